@@ -4,8 +4,8 @@ Startup Code
 @author:    David Schote
 @reworked by: Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   2.0.2
-@change:    02/11/2020
+@version:   2.1.0
+@change:    17/10/2026
 """
 
 # system includes
@@ -14,6 +14,8 @@ from PyQt5.QtWidgets import QApplication
 
 # project includes
 from mainviewcontroller import MainViewController
+from operationmodes import warmupOperations
+from config import configvars
 
 VERSION = "2.0.2"
 AUTHOR = "David Schote, Sula Mueller"
@@ -23,5 +25,7 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     gui = MainViewController()
     gui.show()
+    if configvars.warmupOperations:
+        warmupOperations(gui.OpMngr.listOfOperations)
     gui.connectiondialog.show()
     sys.exit(app.exec_())
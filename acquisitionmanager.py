@@ -3,8 +3,8 @@ Acquisition Manager
 
 @author:    Sula Mueller (based on work of David Schote)
 @contact:   david.schote@ovgu.de
-@version:   2.0.2
-@change:    02/11/2020
+@version:   2.1.0
+@change:    17/10/2026
 
 @summary:   Class for controlling the acquisition
 """
@@ -19,30 +19,30 @@ from warnings import warn
 # project includes
 from globalvars import globals
 from config import configvars as config
-from operationmodes import Spectrum, Relaxometer
-from communicationmanager import ComMngr
-from datamanager import DataManager
-from timevaluemanager import TimeValueManager 
+from operationmodes import Spectrum, Relaxometer, readoutStarts
+from communicationmanager import ComMngr, CommunicationManager, Commands as cmd, PROTOCOL_VERSION
+from datamanager import DataManager, BatchDataManager
 from frequencymanager import FrequencyManager
 from relaxometermanager import RelaxometerManager
+from sequenceanalyzer import analyze
 
 nmspc = globals.GlobalNamespace
 relaxtyp = globals.RelaxationTypes
 seq = globals.Sequences
 
 class AcquisitionManager(QObject):
-    def __init__(self, parent=None, outputsection=None):
+    def __init__(self, parent=None, outputsection=None, session: CommunicationManager = None):
          # @param parent:  Mainviewcontroller (access to parameter layout)
+         # @param session: connection to the console (default: ComMngr)
 
         super(AcquisitionManager, self).__init__(parent)
 
         self.parent = parent
         self.outputsection = outputsection
+        self.session = session if session is not None else ComMngr
         self.acquisitionData = None
         self.T_val = 0
 
-        self.version = (1 << 16) | (1 << 8) | 1  # needs a version to work
-
         # if "acquire"-button in parent is pressed, start acquisition
         self.parent.action_acquire.triggered.connect(self.actionOnRunButtonClicked)
         
@@ -51,27 +51,31 @@ class AcquisitionManager(QObject):
         self.operation = self.parent.OpMngr.listOfOperations.get(self.parent.OpMngr.currentOperationmode, None)  # get current operation
         print("Current operationmode: " + self.operation.sequence[nmspc.sequencefile][0].str)
 
-        self.prepareAcquisition()
-        if isinstance(self.operation, Spectrum):
-            self.runAcquisition()
-            self.postprocessAcquisition()
-        elif isinstance(self.operation, Relaxometer):
-            self.focusFrequency()  # set f_Ex to f_Larmor
-            self.RelaxMngr = RelaxometerManager(self)
-            self.postprocessRelaxometry()
-        else:
-            warn("unrecognized operationmode")
+        # GUI keeps running while waiting for the console, don't start a second acquisition meanwhile
+        self.parent.action_acquire.setEnabled(False)
+        try:
+            self.prepareAcquisition()
+            if isinstance(self.operation, Spectrum):
+                self.runAcquisition()
+                self.postprocessAcquisition()
+            elif isinstance(self.operation, Relaxometer):
+                self.focusFrequency()  # set f_Ex to f_Larmor
+                self.RelaxMngr = RelaxometerManager(self, self.session)
+                self.postprocessRelaxometry()
+            else:
+                warn("unrecognized operationmode")
+        finally:
+            self.parent.action_acquire.setEnabled(True)
     
     def needTval(self) -> bool:
         return not (self.operation.sequence[nmspc.sequencefile][0].str == seq.FID.str or isinstance(self.operation, Relaxometer))
 
     def setTval(self, T_val):
-        # change T_val in sequence file only if changed compared to previous value
+        # patch T_val into the sequence bytestream (only if changed compared to previous value)
         if T_val != self.T_val:
             print("set " + self.operation.sequence[nmspc.sequencefile][0].T_name + " = " + str(T_val) + "ms")
-            TimeValueManager(self.operation.sequence[nmspc.sequencefile][0], T_val)  # set T_val in sequence file
-            self.operation.changeScanparameter(nmspc.sequencebytestream) # run sequence file into assembler
-            self.T_val = T_val
+        self.operation.setTimeValue(T_val)
+        self.T_val = T_val
         
     def preparationDebug(self):
         if isinstance(self.operation, Spectrum):
@@ -80,6 +84,7 @@ class AcquisitionManager(QObject):
             print("   Number of acquired samples = " + str(self.numSamples))
             if self.needTval():
                 print("   " + self.operation.sequence[nmspc.sequencefile][0].T_name + " = " + str(self.T_val))
+            print("   Sequence timing: " + str(analyze(bytes(self.operation.sequencebytestream))))
 
     def prepareAcquisition(self):
         self.parent.clearPlotviewLayout()
@@ -100,41 +105,158 @@ class AcquisitionManager(QObject):
         
         self.preparationDebug()
         
-    def runAcquisition(self, T_val=None):
-        packetIdx: int = 0
-        command: int = 0  # 0 equals request a packet
+    def runAcquisition(self, T_val=None, numAverages: int = 1, session: CommunicationManager = None):
+        # @param numAverages:  number of repetitions of the sequence on the FPGA (one request for all)
+        self.collectAcquisition(self.submitAcquisition(T_val, numAverages, session))
 
+    def submitAcquisition(self, T_val=None, numAverages: int = 1, session: CommunicationManager = None) -> list:
+        """
+        Send the request of an acquisition, don't wait for the data
+        @param T_val:           time value (TE/TI)
+        @param numAverages:     number of repetitions of the sequence on the FPGA (one request for all)
+        @param session:         console to acquire with (default: self.session)
+        @return:                [request, readoutStarts] (request None if rejected)
+        """
         # set time value (TE/TI)
         if T_val is not None:
             self.setTval(T_val)
 
-        # Get/construct package to be send
-        tmp_sequence_pack = ComMngr.constructSequencePacket(self.operation)  # uses self.operation.sequencebytestream
-        tmp_scanparam_pack = ComMngr.constructScanParameterPacket(self.operation)  # uses self.operation.scanparameters.f_Ex
-        tmp_package = {**tmp_sequence_pack, **tmp_sequence_pack, **tmp_scanparam_pack}
-        fields = [command, packetIdx, 0, self.version, tmp_package]
+        # let the FPGA repeat the sequence (LOOP_CTR), all readouts come back in one reply
+        starts = [0]
+        if hasattr(self.operation, 'setRepetitions'):
+            self.operation.setRepetitions(numAverages)
+            starts = self.operation.readoutStarts()
+        numAcqSamples = starts[-1] + self.numSamples  # up to the end of the last readout
+
+        # Get/construct package to be send, the package keeps the current bytestream
+        tmp_sequence_pack = CommunicationManager.constructSequencePacket(self.operation)  # uses self.operation.sequencebytestream
+        return [self.submitRequest(tmp_sequence_pack, numAcqSamples, session), starts]
+
+    def collectAcquisition(self, submitted: list) -> None:
+        """
+        Wait for the data of a submitted acquisition
+        @param submitted:   [request, readoutStarts] (from submitAcquisition)
+        @return:            None (self.batch: all readouts, self.dataobject: last readout; self.haveResult)
+        """
+        readouts = self.collectReadouts(submitted)
+        if readouts is None:
+            return
+        self.batch: BatchDataManager = BatchDataManager(readouts, self.f_Ex, self.numSamples, pipeline=self.operation.pipeline)
+        self.dataobject: DataManager = self.batch[-1]
+
+    def collectReadouts(self, submitted: list) -> np.ndarray:
+        """
+        Wait for the data of a submitted acquisition, don't process it
+        @param submitted:   [request, readoutStarts] (from submitAcquisition)
+        @return:            readouts, shape [readouts, numSamples] (None if nothing received; self.haveResult)
+        """
+        [request, starts] = submitted
+        tmp_data = self.receiveData(request)
+        if tmp_data is None:
+            return None
+        return self.splitReadouts(tmp_data, starts)
+
+    def runSweep(self, T_vals: list, numAverages: int = 1, session: CommunicationManager = None):
+        """
+        Acquire all time values (and averages) with one program and one request
+        @param T_vals:          time values (TE/TI), run back to back
+        @param numAverages:     number of repetitions of all time values on the FPGA
+        @param session:         console to acquire with (default: self.session)
+        @return:                None (self.batch: readouts ordered [average][T_val])
+        """
+        document = self.operation.sweepDocument(T_vals)
+        document.set('LOOP_CTR', int(numAverages))
+        # one @readout window per block, found in the timing of the unrolled program
+        starts = readoutStarts(document, numAverages * len(T_vals))
 
-        response = ComMngr.sendPacket(fields)
+        tmp_data = self.requestData({cmd.sequenceData: document.bytestream}, starts[-1] + self.numSamples, session)
+        if tmp_data is None:
+            return
+
+        readouts = self.splitReadouts(tmp_data, starts)
+        self.batch: BatchDataManager = BatchDataManager(readouts, self.f_Ex, self.numSamples, pipeline=self.operation.pipeline)
+        self.dataobject: DataManager = self.batch[-1]
+
+    def requestData(self, tmp_sequence_pack: dict, numAcqSamples: int, session: CommunicationManager = None) -> np.ndarray:
+        """
+        Send sequence and scan parameters, acquire data
+        @param tmp_sequence_pack:   package with the sequence bytestream
+        @param numAcqSamples:       number of samples to acquire
+        @param session:             console to acquire with (default: self.session)
+        @return:                    received data (None if nothing received)
+        """
+        return self.receiveData(self.submitRequest(tmp_sequence_pack, numAcqSamples, session))
+
+    def submitRequest(self, tmp_sequence_pack: dict, numAcqSamples: int, session: CommunicationManager = None):
+        """
+        Send sequence and scan parameters, don't wait for the data
+        @param tmp_sequence_pack:   package with the sequence bytestream
+        @param numAcqSamples:       number of samples to acquire
+        @param session:             console to acquire with (default: self.session)
+        @return:                    PendingReply (None if the sequence is rejected)
+        """
+        session = session if session is not None else self.session
+        [fields, timeout, error] = session.constructAcquisitionPacket(self.operation, tmp_sequence_pack, numAcqSamples, PROTOCOL_VERSION)
+        if error is not None:
+            self.parent.OpMngr.setOutput("Sequence rejected: " + error)
+            return None
+        return session.sendRequest(fields, timeout, session.expectedReplySize(numAcqSamples))
+
+    def receiveData(self, request) -> np.ndarray:
+        """
+        Wait for the data of a request (GUI keeps running)
+        @param request:     PendingReply of submitRequest
+        @return:            received data (None if nothing received)
+        """
+        response = request.wait() if request is not None else None
         if response is None:
-            self.parent.OpMngr.setOutput("Console not connected. Nothing received.")
+            if request is not None:
+                self.parent.OpMngr.setOutput("Nothing received: " + request.error)
             self.haveResult = False
-            return
+            return None
         self.haveResult = True
+        if request.throughput is not None:
+            print("Received {:.1f} kB in {:.1f} ms ({:.1f} MB/s)".format(
+                request.size / 1e3, (request.receivedAt - request.sentAt) * 1e3, request.throughput))
 
-        # get the actual data
-        tmp_data = np.frombuffer(response[4]['acq'], np.complex64)
+        # get the actual data (complex64: view into the receive buffer, no copy)
+        tmp_data = CommunicationManager.acquiredData(response[4])
         print("Size of received data: {}".format(len(tmp_data)))
-        self.dataobject: DataManager = DataManager(tmp_data, self.f_Ex, self.numSamples)
+        return tmp_data
+
+    def splitReadouts(self, data: np.ndarray, starts: list) -> np.ndarray:
+        """
+        Crop the readouts out of the data of a program (no copy if they are evenly spaced)
+        @param data:    received data
+        @param starts:  first sample of every readout (see operationmodes.readoutStarts)
+        @return:        array of shape [readouts, numSamples] (fewer samples if the data is too short)
+        """
+        starts = np.asarray(starts)
+        complete = starts[starts + self.numSamples <= len(data)]
+        if len(complete) < len(starts):
+            warn("Received {} samples, expected {} readouts of {} samples.".format(len(data), len(starts), self.numSamples))
+            if len(complete) == 0:
+                return data[starts[0]:][np.newaxis, :]
+            starts = complete
+        steps = np.diff(starts)
+        if len(steps) and (np.any(steps != steps[0]) or steps[0] <= 0):
+            return data[starts[:, np.newaxis] + np.arange(self.numSamples)]
+        step = int(steps[0]) if len(steps) else 1
+        windows = np.lib.stride_tricks.sliding_window_view(data[starts[0]:], self.numSamples)
+        return windows[::step][0:len(starts)]
 
     # Function to create a dictionary of output parameters for Spectrum measurement
     def generateSpectrumOutput(self) -> dict:
         outputvalues: dict = {}
         if hasattr(self, 'dataobject') and isinstance(self.operation, Spectrum):
-            outputvalues["SNR"] = round(self.dataobject.get_snr(), config.roundToDigits)
-            outputvalues["FWHM [Hz]"] = round(self.dataobject.get_fwhm()[1], config.roundToDigits)
-            outputvalues["FWHM [ppm]"] = round(self.dataobject.get_fwhm()[2], config.roundToDigits)
-            outputvalues["Center Frequency [MHz]"] = round(self.dataobject.get_peakparameters()[2], config.roundToDigits)
-            outputvalues["Signal Maximum [V]"] = round(self.dataobject.get_peakparameters()[3], config.roundToDigits)
+            # metrics are computed once per dataobject and cached
+            [_, fwhm_hz, fwhm_ppm] = self.dataobject.fwhm
+            [_, _, peakFreq, t_peakValue] = self.dataobject.peakparameters
+            outputvalues["SNR"] = round(self.dataobject.snr, config.roundToDigits)
+            outputvalues["FWHM [Hz]"] = round(fwhm_hz, config.roundToDigits)
+            outputvalues["FWHM [ppm]"] = round(fwhm_ppm, config.roundToDigits)
+            outputvalues["Center Frequency [MHz]"] = round(peakFreq, config.roundToDigits)
+            outputvalues["Signal Maximum [V]"] = round(t_peakValue, config.roundToDigits)
         return outputvalues
 
     # Function to create a dictionary of output parameters for Relaxometry
@@ -191,4 +313,4 @@ class AcquisitionManager(QObject):
 
     @pyqtSlot(bool)
     def focusFrequency(self) -> None:  # set f_Ex to f_Larmor
-        FrequencyManager(self)
+        FrequencyManager(self, session=self.session)
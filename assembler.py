@@ -18,10 +18,21 @@
 ################################################################################
 
 import pdb # Debugging
+import os
 import numpy as np
 import math
 import logging # For errors
-import struct
+
+# Instruction layout
+OPCODE_SHIFT = 58
+REG_SHIFT_A = 32
+REG_SHIFT_B = 40
+REG_MASK = 0x1f
+ADDR_MASK = 0xffffffff
+CONST_MASK = (1 << 40) - 1
+WORD_MASK = (1 << 64) - 1
+CMD_DTYPE = np.dtype('<u8')
+WORD_DTYPE = np.dtype('<u4')
 
 class Assembler:
 	def __init__(self):
@@ -53,19 +64,19 @@ class Assembler:
 		self.opcode_table = opcode_table
 		self.bit_table = bit_table
 		self.var_table = {}
+		self.words = None
 
-		# Logging
-		self.logger = logging.getLogger()
-		logging.basicConfig(filename = 'assembler.log', filemode = 'w', level = logging.DEBUG)
+		# Logging (to assembler.log only when run as a script, see below)
+		self.logger = logging.getLogger('assembler')
 
 
 	def var_parser(self,line):
-		''' Parses the variables '''
+		''' Parses the variables, returns the 64-bit command as integer '''
 		line = line.replace(' ','') # Remove spaces
 		equals_index = line.find('=') # Get everything to the right of the equals sign
 		cmd = line[equals_index + 1:len(line)]
 		var_name = line[0:equals_index] # name of variable
-		cmds_bit = []
+		cmd_out = 0
 		cmd_split = cmd.split('|') # Parse bit patterns
 
 		# Loop over words
@@ -73,28 +84,22 @@ class Assembler:
 			# Check if the word is hex
 			if any(str.isdigit(c) for c in word):
 				try:
-					var = format(int(word, 16), 'b') # NOTE: value of var must be in base 16
-					cmd_out = var.zfill(64)
+					cmd_out = int(word, 16) & WORD_MASK # NOTE: value of var must be in base 16
 					# Add entry to var_table
 					self.var_table[var_name] = self.pc # Indexed by address of the variable, for LD64
 					self.pc += 1
 					return cmd_out
 
 				except ValueError:
-					logger.exception("Invalid hexadecimal number {}".format(cmd), stack_info=True)
+					self.logger.exception("Invalid hexadecimal number {}".format(cmd), stack_info=True)
 
 			else: # Must be a bit pattern
 				cmd_byte = self.bit_table.get(word)
 				# If not in the dictionary, it is an invalid command
 				if not cmd_byte:
-					logging.error("Unknown command {}".format(word), stack_info=True)
+					self.logger.error("Unknown command {}".format(word), stack_info=True)
 					raise ValueError("Unknown command {}".format(word))
-				cmd_bit = int(cmd_byte, 16) # Convert to bits
-				cmds_bit.append(cmd_bit)
-
-		np_bits = np.array(cmds_bit) # Make numpy array to make bitwise computation easier
-		cmd_out = format(np.bitwise_or.reduce(np_bits), 'b') # String in binary
-		cmd_out = cmd_out.zfill(64) # Zero pad to make it 64 bits
+				cmd_out |= int(cmd_byte, 16) # Combine bit patterns
 
 		# Add entry to var_table
 		self.var_table[var_name] = self.pc # Indexed by address of the variable, for LD64
@@ -102,75 +107,62 @@ class Assembler:
 		return cmd_out
 
 	def make_cmd(self, line):
-		''' Synthesizes the command in binary '''
+		''' Synthesizes the 64-bit command as integer '''
 		line = line.split(' ') # Remove spaces
 		opcode = line[0] # Get the opcode
 
 		# Error checking
 		if opcode not in self.opcode_table.keys():
-			logging.error("Unknown opcode {}".format(opcode), stack_info=True)
+			self.logger.error("Unknown opcode {}".format(opcode), stack_info=True)
 			raise ValueError("Unknown opcode {} on line {}".format(opcode, line))
 
-		opcode_bin = self.opcode_table[opcode][0] # Convert to binary from the dict
+		cmd = int(self.opcode_table[opcode][0], 2) << OPCODE_SHIFT
 
 		# Cmds without format A or B - NOP and HALT
 		if len(self.opcode_table[opcode]) < 2:
-			remaining_bits = 64 - len(opcode_bin)
-			cmd = opcode_bin + '0'.zfill(remaining_bits)
+			return cmd
 
-		# Format A
-		elif self.opcode_table[opcode][1] == 'A':
-			reg_addr = format(int(line[1], 10), 'b').zfill(5)
-			#print(reg_addr)
+		# Format A: opcode | 21 unused bits | 5 bit register | 32 bit address
+		if self.opcode_table[opcode][1] == 'A':
+			reg_addr = int(line[1], 10)
 			if opcode == 'LD64' or opcode == 'JNZ': # Reg and addr specified
 				if line[2] in self.var_table.keys():
 					addr = self.var_table[line[2]] # Look up address of variable
-					#print(self.var_table)
-					#print(addr)
-
 				else:
 					try:
 						addr = int(line[2], 16) # Must be in hex
-						#print(addr)
 					except ValueError:
-						logger.exception("Invalid hexadecimal number {}".format(line[2]), stack_info=True)
-
-				dir_addr = format(int(addr), 'b').zfill(32)
+						self.logger.exception("Invalid hexadecimal number {}".format(line[2]), stack_info=True)
+						raise
 
 			elif opcode == 'DEC' or opcode == 'INC': # Reg specified
-				dir_addr = '0'.zfill(32)
+				addr = 0
 
 			else: # Addr specified
-				dir_addr = format(int(line[1], 16), 'b').zfill(32)
-				reg_addr = '0'.zfill(5)
+				addr = int(line[1], 16)
+				reg_addr = 0
 
 			# Make the command
-			remaining_bits = 64 - len(opcode_bin) - len(reg_addr) - len(dir_addr) # Remaining bits
-			remainder = '0'.zfill(remaining_bits)
-			cmd = opcode_bin + remainder + reg_addr + dir_addr
+			cmd |= (reg_addr & REG_MASK) << REG_SHIFT_A | (int(addr) & ADDR_MASK)
 			self.pc += 1 # Increment pc by 1
 
-		# Format B
+		# Format B: opcode | 13 unused bits | 5 bit register | 40 bit constant
 		elif self.opcode_table[opcode][1] == 'B':
 			if opcode == 'PR': # PR
-				conversion_factor = 1/(7e-3) # us to ns, assuming 7ns clock cycle
-				num_cycles = math.floor(int(line[2]) * conversion_factor) # Round down
-				const = format(num_cycles, 'b').zfill(40)
-				reg_addr = format(int(line[1]), 'b')
-				#print(reg_addr)
-				remaining_bits = 64 - len(const) - len(opcode_bin) - len(reg_addr)
-				remainder = '0'.zfill(remaining_bits)
-				cmd = opcode_bin + remainder + reg_addr + const
-				#print(cmd)
+				const = self.delay_cycles(int(line[2]))
+				cmd |= (int(line[1]) & REG_MASK) << REG_SHIFT_B | const
 			else: # TXOFFSET and GRADOFFSET
-				# const = format(int(line[1], 16), 'b').zfill(40)
-				const = format(int(line[1], 10), 'b').zfill(40)
-				remaining_bits = 64 - len(const) - len(opcode_bin)
-				remainder = '0'.zfill(remaining_bits)
-				cmd = opcode_bin + remainder + const
+				cmd |= int(line[1], 10) & CONST_MASK
 		return cmd
 
-	def strip_lines(self, line):
+	@staticmethod
+	def delay_cycles(delay):
+		''' Converts a delay in us to the 40 bit number of clock cycles used by PR '''
+		conversion_factor = 1/(7e-3) # us to ns, assuming 7ns clock cycle
+		return math.floor(delay * conversion_factor) & CONST_MASK # Round down
+
+	@staticmethod
+	def strip_lines(line):
 		''' Takes a sequence of lines and strip comments and commas '''
 		line = line.replace(',','') # Remove the comma
 		line = line.replace('\n', '') # Remove newline characters
@@ -181,101 +173,74 @@ class Assembler:
 		#print(line)
 		return line
 
-	def assemble(self, inp_file):
-		''' Converts an input txt file to binary and outputs a text file '''
-		# Open the file
-		f = open(inp_file)
-		self.logger.info("Opening file")
-		lines = f.readlines()
-
-    	# Parse the lines
+	def encode(self, lines):
+		''' Converts source lines to a numpy buffer of 32-bit words (low half of each command first) '''
 		cmds = []
-		hex_cmds = []
 		line_ctr = 1
 		for line in lines:
 			line_stripped = self.strip_lines(line)
-			self.logger.info("Line {0} stripped = {1}".format(line_ctr, line_stripped))
-    		# If line contains '=', call the var parser
+			self.logger.info("Line %d stripped = %s", line_ctr, line_stripped)
+			# If line contains '=', call the var parser
 			if '=' in line_stripped:
 				cmd = self.var_parser(line_stripped)
 			else:
 				cmd = self.make_cmd(line_stripped)
-
-			# Cut the line in half to convert to byte array, otherwise it is too large
-			half_len = int(len(cmd)/2)
-			cmd1 = cmd[0:half_len]
-			cmd2 = cmd[half_len:len(cmd)]
-
-			# Put hex command in log, for debugging
-			# hex_cmd = hex(int(cmd,2))
-			hex_cmd1 = hex(int(cmd1,2))
-			hex_cmd2 = hex(int(cmd2,2))
-			# self.logger.info("Hex cmd = {}".format(hex_cmd))
 			cmds.append(cmd) # Append the command to an array
-			# hex_cmds.append(hex_cmd)
-			# Reorder them
-			hex_cmds.append(hex_cmd2)
-			hex_cmds.append(hex_cmd1)
 			line_ctr += 1
 
-			self.logger.info("Hex cmd1 = {}\n".format(hex_cmd1))
-			self.logger.info("Hex cmd2 = {}\n".format(hex_cmd2))
-
-
-		# Make a byte array of hex commands
-		# hex_cmd = format(int(hex_cmd,16),'x') # remove the 0x at the beginning
-
+		# Reinterpreting the little endian 64-bit commands as 32-bit words puts the low half first,
+		# which is the order the server expects
+		words = np.array(cmds, dtype=CMD_DTYPE).view(WORD_DTYPE)
+		self.logger.info("Number of words = %d", len(words))
+		return words
 
-		hex_ints = [int(hex_cmd, 16) for hex_cmd in hex_cmds]
-		self.logger.info("Hex ints = {}\n".format(hex_ints))
-
-		# Convert to byte array
-		b = bytes()
-		hex_bytes = [struct.pack('<I', hex_int) for hex_int in hex_ints]
-		b = b.join(hex_bytes)
-
-		# Logging
-		self.logger.info("Hex bytes = {}\n".format(hex_bytes))
-		self.logger.info("Length of hex bytes = {}\n".format(len(hex_bytes)))
-		self.logger.info("b = {}".format(b))
-		self.logger.info("Length of byte array = {}".format(len(b)))
-
-		# # Binary file
-		# with open('out_bin.txt', "w") as out_file:
-		# 	[out_file.write("{}\n".format(cmd)) for cmd in cmds]
-        #
-		# # Hex file
-		# with open('out_hex.txt', "w") as out_file:
-		# 	[out_file.write("{}\n".format(hex_cmd)) for hex_cmd in hex_cmds]
-		# self.logger.info('Done')
-
-		# Machine code file
-		output_filename = inp_file[0:-4] + '_hex.txt'
+	@staticmethod
+	def write_listing(words, output_filename):
+		''' Writes the readable machine code of a word buffer to a text file '''
 		with open(output_filename, "w") as out_file:
-			idx = 0
-			for hex_cmd in hex_cmds:
-				# # for generating only machine cmd
-				# if idx%2: # odd idx, even row num
-				# 	out_file.write("pulseq_memory[{}] = {};\n\n".format(idx, hex_cmd))
-				# else: # even idx, odd row num
-				# 	out_file.write("pulseq_memory[{}] = {}; \n".format( idx, hex_cmd))
-
+			for idx, word in enumerate(words.tolist()):
 				# for generating readable machine code
 				if idx%2: # odd idx, even row num
-					out_file.write("\tpulseq_memory[{}] = {}\n\n".format(idx, hex_cmd))
+					out_file.write("\tpulseq_memory[{}] = {}\n\n".format(idx, hex(word)))
 				else: # even idx, odd row num
 					out_file.write("A[{}]\tpulseq_memory[{}] = {} \n".format( hex(int(idx/2)),
-								   idx, hex_cmd))
-				idx += 1
+								   idx, hex(word)))
 
-		f.close()
+	def assemble(self, inp_file):
+		''' Converts an input txt file to binary and outputs a text file '''
+		# Open the file
+		self.logger.info("Opening file")
+		with open(inp_file) as f:
+			lines = f.readlines()
+
+		# Parse the lines
+		self.words = self.encode(lines)
+		b = self.words.tobytes()
+		self.logger.info("Length of byte array = %d", len(b))
+
+		# Machine code file
+		output_filename = inp_file[0:-4] + '_hex.txt'
+		self.write_listing(self.words, output_filename)
 		return b
 
 assembler = Assembler()
 
-# Sample usage
+# Usage: python assembler.py [paths]
+# Files are assembled to <file>_hex.txt, directories (default: sequence) are compiled in parallel
+# into binary artifacts for the assembly cache, unchanged files are skipped
 if __name__ == "__main__":
-	a = Assembler()
-	inp_file = 'sequence/basic/se_default.txt'
-	hex_bytes = a.assemble(inp_file)
-	#print("Hex bytes = {}\n".format(hex_bytes))
+	import argparse
+	from assemblycache import compileAll
+
+	logging.basicConfig(filename = 'assembler.log', filemode = 'w', level = logging.DEBUG)
+	parser = argparse.ArgumentParser(description = 'Assembler for the Red Pitaya sequencer')
+	parser.add_argument('paths', nargs = '*', default = ['sequence'], help = 'sequence files or directories')
+	parser.add_argument('-j', '--jobs', type = int, default = None, help = 'number of worker processes')
+	parser.add_argument('-f', '--force', action = 'store_true', help = 'also compile unchanged sequences')
+	args = parser.parse_args()
+
+	for path in args.paths:
+		if os.path.isdir(path):
+			compileAll(path, args.jobs, args.force)
+		else:
+			hex_bytes = Assembler().assemble(path)
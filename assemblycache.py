@@ -0,0 +1,218 @@
+"""
+Assembly Cache
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Content-addressed cache for assembled sequence bytestreams.
+            Programs are keyed by a hash of the normalized sequence source, so the same
+            program is only assembled once. Entries are held in an in-memory LRU and,
+            optionally, as sequence artifacts in a '.asmcache' folder next to the sequence file,
+            which are memory-mapped when loaded.
+            compileAll() precompiles a whole sequence directory into the disk tier
+            (run 'python assembler.py sequence').
+"""
+
+# system includes
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# project includes
+from config import configvars
+from assembler import Assembler
+from sequenceartifact import EXTENSION, loadArtifact, writeArtifact
+
+class AssemblyCache:
+    def __init__(self, maxsize: int = configvars.assemblyCacheSize, diskcache: bool = configvars.assemblyDiskCache):
+        """
+        Initialization of assembly cache
+        @param maxsize:     number of programs kept in memory
+        @param diskcache:   store/look up programs on disk next to the sequence file
+        @return:            None
+        """
+        self.maxsize = maxsize
+        self.diskcache = diskcache
+        self._entries = OrderedDict()  # hash -> bytestream (bytes or mapped memoryview), most recently used last
+        self._lock = threading.Lock()  # operations may be assembled from a warm-up thread
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(lines) -> list:
+        # the assembler only sees lines stripped of comments and commas
+        return [Assembler.strip_lines(line) for line in lines]
+
+    @classmethod
+    def sourcehash(cls, lines) -> str:
+        return hashlib.sha256('\n'.join(cls.normalize(lines)).encode()).hexdigest()
+
+    @staticmethod
+    def diskpath(inp_file: str, key: str) -> str:
+        return os.path.join(os.path.dirname(inp_file), '.asmcache', key + EXTENSION)
+
+    def assemble(self, inp_file: str) -> bytes:
+        """
+        Get the bytestream of a sequence file, assemble only if not cached
+        @param inp_file:    path of the sequence file
+        @return:            assembled bytestream
+        """
+        with open(inp_file) as f:
+            lines = f.readlines()
+        return self.assembleLines(lines, inp_file)
+
+    def assembleLines(self, lines: list, inp_file: str = None, slots: dict = None) -> bytes:
+        """
+        Get the bytestream of sequence source lines, assemble only if not cached
+        @param lines:       lines of the sequence source
+        @param inp_file:    path of the sequence file (for listing and disk tier)
+        @param slots:       parameter slots of the sequence (stored in the artifact)
+        @return:            assembled bytestream
+        """
+        key = self.sourcehash(lines)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            b = None
+            if self.diskcache and inp_file is not None:
+                b = self.loadFromDisk(inp_file, key)
+                if b is not None:
+                    self.diskHits += 1
+            if b is None:
+                self.misses += 1
+                assembler = Assembler()
+                words = assembler.encode(lines)
+                b = words.tobytes()
+                if inp_file is not None:
+                    assembler.write_listing(words, inp_file[0:-4] + '_hex.txt')
+                    if self.diskcache:
+                        self.storeToDisk(inp_file, key, words, assembler.var_table, slots)
+
+            self._entries[key] = b
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return b
+
+    @classmethod
+    def loadFromDisk(cls, inp_file: str, key: str):
+        # mapped words of the artifact, no copy
+        artifact = loadArtifact(cls.diskpath(inp_file, key))
+        if artifact is None or artifact.sourcehash != key:
+            return None
+        return artifact.words
+
+    @classmethod
+    def storeToDisk(cls, inp_file: str, key: str, words, variables: dict = None, slots: dict = None) -> None:
+        path = cls.diskpath(inp_file, key)
+        try:
+            writeArtifact(path, words, key, variables, slots)
+        except OSError as e:
+            print("Could not write assembly cache file {}: {}".format(path, e))
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'disk hits': self.diskHits,
+            'misses': self.misses,
+            'entries': len(self._entries)
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+# initialize an instance
+AsmCache = AssemblyCache()
+
+def findSequences(root: str) -> list:
+    # all sequence sources below root (listings and hidden folders excluded)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        paths += [os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.txt') and not f.endswith('_hex.txt')]
+    return paths
+
+def compileFile(inp_file: str) -> list:
+    """
+    Assemble a sequence file, write its listing and sequence artifact (worker of compileAll)
+    @param inp_file:    path of the sequence file
+    @return:            [source hash, time in s]
+    """
+    from sequencedocument import SequenceDocument  # imports this module
+    start = time.perf_counter()
+    with open(inp_file) as f:
+        lines = f.readlines()
+    key = AssemblyCache.sourcehash(lines)
+    assembler = Assembler()
+    words = assembler.encode(lines)
+    assembler.write_listing(words, inp_file[0:-4] + '_hex.txt')
+    AssemblyCache.storeToDisk(inp_file, key, words, assembler.var_table, SequenceDocument(lines, inp_file).slots)
+    return [key, time.perf_counter() - start]
+
+def compileAll(root: str = 'sequence', jobs: int = None, force: bool = False) -> dict:
+    """
+    Compile all sequences below a directory in parallel, skip unchanged sources
+    @param root:    sequence directory
+    @param jobs:    number of worker processes (default: number of CPUs)
+    @param force:   compile unchanged sources as well
+    @return:        manifest (relative path -> mtime, source hash, compile time)
+    """
+    start = time.perf_counter()
+    manifestpath = os.path.join(root, '.asmcache', 'manifest.json')
+    try:
+        with open(manifestpath) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    # unchanged: same modification time, or same content hash after touching the file
+    todo = {}
+    for path in findSequences(root):
+        rel = os.path.relpath(path, root)
+        mtime = os.stat(path).st_mtime_ns
+        entry = manifest.get(rel)
+        if not force and entry is not None and os.path.exists(AssemblyCache.diskpath(path, entry['hash'])):
+            if entry['mtime'] == mtime:
+                print("{}: unchanged".format(rel))
+                continue
+            with open(path) as f:
+                if AssemblyCache.sourcehash(f.readlines()) == entry['hash']:
+                    entry['mtime'] = mtime
+                    print("{}: unchanged (touched)".format(rel))
+                    continue
+        todo[path] = mtime
+
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(compileFile, path): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                rel = os.path.relpath(path, root)
+                try:
+                    [key, seconds] = future.result()
+                except Exception as e:
+                    print("{}: FAILED ({})".format(rel, e))
+                    failed.append(rel)
+                    continue
+                manifest[rel] = {'mtime': todo[path], 'hash': key, 'seconds': round(seconds, 6)}
+                print("{}: compiled in {:.2f} ms".format(rel, seconds * 1e3))
+
+    os.makedirs(os.path.dirname(manifestpath), exist_ok=True)
+    with open(manifestpath, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print("Compiled {} of {} sequences in {:.2f} s ({} failed).".format(
+        len(todo) - len(failed), len(findSequences(root)), time.perf_counter() - start, len(failed)))
+    return manifest
@@ -4,22 +4,44 @@ Communication Manager
 @author:    David Schote
 @reworked by: Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   1.0.2
-@change:    02/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Manages the connection to the server, constructs and sends packages (via msgpack)
+            Requests are answered asynchronously: sendRequest() returns a PendingReply that
+            emits a signal once the complete reply arrived (driven by readyRead), sendPacket()
+            waits for it in a local event loop, so the GUI keeps running.
+            Replies are received in large chunks into a buffer preallocated for the expected
+            size and decoded once, binary fields (acquired data) stay views into that buffer.
+            Up to configvars.requestWindow requests are sent ahead, replies are matched by their
+            packet index and handed out in the order of the requests.
+            The console keeps the last program: a request only carries its hash, or the changed
+            instruction words (seq_patch) against it, the full program is sent when necessary.
+            Acquired data can be transferred quantized (I/Q as int16/int8/float16 with a scale),
+            acquiredData() turns it back into complex64.
+            Every answered request leaves its timing (encoding, bytes, time to first byte,
+            receiving, decoding) in self.wireStats.
+            Once the link was probed (linkprobe), timeouts include the transfer time of the
+            expected reply size and the window grows to hide the latency of the link.
 """
 # system includes
 from PyQt5.QtNetwork import QAbstractSocket, QTcpSocket
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QTimer, QEventLoop
 from warnings import warn
+from collections import deque, OrderedDict
 import numpy as np
 import struct
+import time
+import hashlib
 import msgpack
 
 # project includes
 from config import configvars
 from globalvars import globals
+from assembler import WORD_DTYPE
+from sequenceanalyzer import analyze
+from replydecoder import unpackReply, skipReply
+from wirestats import WireStats
 
 nmspc = globals.GlobalNamespace
 
@@ -36,6 +58,17 @@ states = {
 # get the current state
 status = QAbstractSocket.SocketState
 
+PROTOCOL_VERSION = (1 << 16) | (1 << 8) | 1  # needs a version to work
+# transfer formats of acquired data: I/Q value type
+ACQUISITION_FORMATS = {
+    'complex64': np.dtype('<f4'),
+    'int16': np.dtype('<i2'),
+    'float16': np.dtype('<f2'),
+    'int8': np.dtype('i1')
+}
+RECEIVE_BUFFER_SIZE = 1 << 16  # min. size of the receive buffer in bytes
+REPLY_OVERHEAD = 1 << 10  # bytes of a reply besides the acquired data (header, other fields)
+
 # Commands Class for Marcos-Server
 class Commands:
     fpgaClock = 'fpga_clk' # array of 3 values unsigned int (clock words)
@@ -54,25 +87,147 @@ class Commands:
     recomputeTxPulses = 'recomp_pul' # boolean (recompute the TX pulses)
     txRfWaveform = 'raw_tx_data' # binary byte array (write the RF waveform)
     sequenceData = 'seq_data' # binary byte array (sequence instructions)
+    sequenceHash = 'seq_hash' # string (hash of the sequence, console answers with the hash of its program)
+    sequenceBase = 'seq_base' # string (hash of the program seq_patch applies to)
+    sequencePatch = 'seq_patch' # binary byte array (pairs of uint32: word index, new word)
     runAcquisition = 'acq' # unsigned int [numSamples] (runs 'seq_data' and returns array of 64-bit complex floats, length = numSamples)
+    acquisitionFormat = 'acq_format' # string (requested/used format of 'acq': complex64, int16, float16, int8)
+    acquisitionScale = 'acq_scale' # float (factor from quantized values to volts)
     testRxThroughput = 'test_throughput' # unsigned int [arg] (return array map, array-length = arg)
     requestPacket = 0
+    emergencyStopPacket = 1
+    closeServerPacket = 2
+    replyPacket = 128
+
+class PendingReply(QObject):
+    finished = pyqtSignal(object, name='onFinished')  # reply
+    failed = pyqtSignal(str, name='onFailed')  # reason
+
+    def __init__(self, packet, timeout: int = configvars.communicationTimeout, expectedSize: int = 0, parent=None):
+        """
+        Initialization of a request to the server
+        @param packet:          packet fields [command, packet_idx, 0, version, data]
+        @param timeout:         max. time in ms to wait for the reply once all previous requests are answered
+        @param expectedSize:    expected size of the reply in bytes (receive buffer is allocated for it)
+        @param parent:          CommunicationManager
+        @return:                None
+        """
+        super(PendingReply, self).__init__(parent)
+        self.packet = packet
+        self.timeout = timeout
+        self.expectedSize = expectedSize
+        self.reply = None
+        self.error = None
+        self.done = False
+        self.arrived = None  # [reply, size] until handed out in order
+        self.sequenceHash = None  # hash of the program the written packet refers to
+        self.sentFull = True  # written packet carried the full program
+        self.resends = 0
+        self.createdAt = time.perf_counter()
+        self.encodeTime = 0.0  # s, of all writes (resends included)
+        self.bytesSent = 0
+        self.decodeTime = 0.0  # s
+        self.sentAt = None
+        self.firstByteAt = None
+        self.receivedAt = None
+        self.size = 0  # bytes of the reply
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(lambda: self.fail("No reply within {} ms.".format(self.timeout)))
+
+    def start(self) -> None:
+        self.sentAt = time.perf_counter()
+
+    def watch(self) -> None:
+        # the timeout runs from the moment this is the oldest outstanding request (console works on it)
+        if not self.done and not self._timer.isActive():
+            self._timer.start(self.timeout)
+
+    def arrive(self, reply, size: int = 0) -> None:
+        # reply is complete, kept until the replies of all previous requests are handed out
+        self._timer.stop()
+        self.receivedAt = time.perf_counter()
+        self.arrived = [reply, size]
+
+    def resolve(self, reply, size: int = 0) -> None:
+        if self.done:  # cancelled or timed out, reply is dropped
+            return
+        self._timer.stop()
+        self.receivedAt = self.receivedAt or time.perf_counter()
+        self.size = size
+        self.reply = reply
+        self.done = True
+        self.finished.emit(reply)
+
+    def fail(self, error: str) -> None:
+        if self.done:
+            return
+        self._timer.stop()
+        self.error = error
+        self.done = True
+        self.failed.emit(error)
+
+    def cancel(self) -> None:
+        self.fail("Cancelled.")
+
+    @property
+    def throughput(self) -> float:
+        # MB/s from first to last byte of the reply
+        if self.receivedAt is None or self.firstByteAt is None or self.receivedAt <= self.firstByteAt:
+            return None
+        return self.size / (self.receivedAt - self.firstByteAt) / 1e6
+
+    def wait(self):
+        """
+        Wait for the reply, events (GUI) are processed meanwhile
+        @return:    reply (None if failed)
+        """
+        if not self.done:
+            loop = QEventLoop()
+            self.finished.connect(loop.quit)
+            self.failed.connect(loop.quit)
+            loop.exec_()
+        return self.reply
 
 class CommunicationManager(QTcpSocket, QObject):
     statusChanged = pyqtSignal(str, name='onStatusChanged')
 
-    def __init__(self):
+    def __init__(self, window: int = configvars.requestWindow):
+        """
+        Initialization of communication manager
+        @param window:  max. number of requests sent before their replies arrived
+        @return:        None
+        """
         super(CommunicationManager, self).__init__()
         self.stateChanged.connect(self.getConnectionStatus)
+        self.readyRead.connect(self.readReplies)
+        self.disconnected.connect(self.abortRequests)
+        self.window = window
+        self._buffer = None  # receive buffer of the current reply
+        self._fill = 0  # bytes received in the buffer
+        self._queue = deque()  # requests not yet written
+        self._inflight = OrderedDict()  # packet index -> written request, in order of sending
+        self._packetIdx = 0  # index of the next request
+        self._resend = deque()  # written requests the console couldn't run (unknown program)
+        self.dedup = configvars.sequenceDedup
+        self._consoleProgram = None  # [hash, bytestream] the console holds after the written requests
+        self._decodeTime = 0.0  # s spent decoding the reply in the buffer so far
+        self._scan = [0, 1]  # [position, objects left] of the walk over the headers of the current reply
+        self.wireStats = WireStats()
+        self.linkModel = None  # LinkModel of the connection (see linkprobe), extends timeouts and the window
 
-    def connectClient(self, IP: str) -> [bool]:  # this is the function being debugged right now
+    def connectClient(self, IP: str, port: int = 1001) -> [bool]:  # this is the function being debugged right now
         """
         Connect server and host through server's IP
-        @param IP:  IP address of the server
-        @return:    success of connection
+        @param IP:      IP address of the server
+        @param port:    port of the server
+        @return:        success of connection
         """
         
-        self.connectToHost(IP, 1001)
+        self._consoleProgram = None
+        self.dedup = configvars.sequenceDedup
+        self.linkModel = None  # other link, probe again
+        self.connectToHost(IP, port)
         self.waitForConnected(2000)
         if self.state() == QAbstractSocket.ConnectedState:
             print("Connection to server established.")
@@ -124,26 +279,319 @@ class CommunicationManager(QTcpSocket, QObject):
         package: dict = {}
 
         if hasattr(operation, 'sequence') and len(operation.sequence) > 1:
-            package[Commands.sequenceData] = operation.sequence[nmspc.sequencebytestream]
+            # bytes-like (bytes or memoryview of a mapped sequence artifact), packed without conversion
+            package[Commands.sequenceData] = operation.sequence[nmspc.sequencebytestream][0]
         else:
             warn("ERROR: No sequence bytestream!")
         return package
 
-    def sendPacket(self, packet):
+    @staticmethod
+    def constructAcquisitionPacket(operation, tmp_sequence_pack: dict, numAcqSamples: int, version: int = PROTOCOL_VERSION) -> list:
+        """
+        Construct the packet of an acquisition, check the sequence can deliver the samples
+        @param operation:           operation (scan parameters)
+        @param tmp_sequence_pack:   package with the sequence bytestream
+        @param numAcqSamples:       number of samples to acquire
+        @param version:             protocol version
+        @return:                    [packet fields, timeout in ms, error (None if the sequence can run)]
+        """
+        # reject impossible programs, wait as long as the program runs
+        timeout = configvars.communicationTimeout
+        if Commands.sequenceData in tmp_sequence_pack:
+            timing = analyze(bytes(tmp_sequence_pack[Commands.sequenceData]))
+            error = timing.errors[0] if not timing.valid else None
+            if error is None and numAcqSamples > timing.readoutSamples:
+                error = "{} samples requested, sequence only acquires {}.".format(numAcqSamples, timing.readoutSamples)
+            if error is not None:
+                return [None, timeout, error]
+            timeout += int(np.ceil(timing.duration))
+
+        tmp_scanparam_pack = CommunicationManager.constructScanParameterPacket(operation)  # uses operation.scanparameters.f_Ex
+        tmp_package = {**tmp_sequence_pack, **tmp_scanparam_pack}
+        tmp_package[Commands.runAcquisition] = numAcqSamples
+        if configvars.acquisitionFormat != 'complex64':
+            tmp_package[Commands.acquisitionFormat] = configvars.acquisitionFormat
+        packetIdx: int = 0  # assigned by sendRequest
+        return [[Commands.requestPacket, packetIdx, 0, version, tmp_package], timeout, None]
+
+    @staticmethod
+    def expectedReplySize(numAcqSamples: int) -> int:
+        # bytes of the acquired data in the requested format
+        return numAcqSamples * 2 * ACQUISITION_FORMATS[configvars.acquisitionFormat].itemsize
+
+    @staticmethod
+    def acquiredData(data: dict) -> np.ndarray:
+        """
+        Get the acquired data of a reply as complex64
+        @param data:    reply data (reply[4])
+        @return:        acquired data (complex64 is a view into the receive buffer, quantized data is scaled into a new array)
+        """
+        raw = data[Commands.runAcquisition]
+        fmt = data.get(Commands.acquisitionFormat, 'complex64')  # consoles without quantization send complex64
+        if fmt == 'complex64':
+            return np.frombuffer(raw, np.complex64)
+        values = np.frombuffer(raw, ACQUISITION_FORMATS[fmt])
+        samples = np.empty(len(values) // 2, np.complex64)
+        # I/Q pairs are scaled straight into real and imaginary parts
+        np.multiply(values[0:2 * len(samples)], np.float32(data.get(Commands.acquisitionScale, 1.0)),
+                    out=samples.view(np.float32), casting='unsafe')
+        return samples
+
+    def sendRequest(self, packet, timeout: int = configvars.communicationTimeout, expectedSize: int = 0) -> PendingReply:
+        """
+        Queue packet for sending, don't wait for the reply
+        @param packet:          packet fields [command, packet_idx, 0, version, data] (packet_idx is assigned here)
+        @param timeout:         max. time in ms to wait for the complete reply after sending
+                                (plus the transfer time of the expected size, if the link was probed)
+        @param expectedSize:    expected size of the reply in bytes (e.g. 8 * number of samples)
+        @return:                PendingReply (emits finished/failed)
+        """
+        if self.linkModel is not None:
+            timeout += int(self.linkModel.timeout(expectedSize))
+        request = PendingReply(packet, timeout, expectedSize, self)
+        if self.state() != QAbstractSocket.ConnectedState:
+            # fail from the event loop, so the caller can still connect to the signals
+            QTimer.singleShot(0, lambda: request.fail("No connection to server."))
+            return request
+        request.failed.connect(self.deliverReplies)  # a timed out request doesn't block the queue
+        packet[1] = self._packetIdx
+        self._packetIdx = (self._packetIdx + 1) & 0xffffffff
+        self._queue.append(request)
+        self.writeRequests()
+        return request
+
+    def sendPacket(self, packet, timeout: int = configvars.communicationTimeout, expectedSize: int = 0):
+        """
+        Send packet and wait for the reply (GUI keeps running)
+        @param packet:          packet fields [command, packet_idx, 0, version, data]
+        @param timeout:         max. time in ms to wait for the complete reply
+        @param expectedSize:    expected size of the reply in bytes (e.g. 8 * number of samples)
+        @return:                reply (None if nothing/incomplete received)
+        """
         if self.state() != QAbstractSocket.ConnectedState:
             print("No connection to server, doing nothing")
             return
-        self.write(msgpack.packb(packet))
-        unpacker = msgpack.Unpacker()
-        self.waitForReadyRead(1000)
+        request = self.sendRequest(packet, timeout, expectedSize)
+        reply = request.wait()
+        if request.error is not None:
+            print("Request failed: " + request.error)
+        elif request.throughput is not None:
+            print("Received {:.1f} kB in {:.1f} ms ({:.1f} MB/s)".format(
+                request.size / 1e3, (request.receivedAt - request.sentAt) * 1e3, request.throughput))
+        return reply
+
+    def emergencyStop(self) -> None:
+        """
+        Stop the console immediately, drop all outstanding requests
+        @return:    None
+        """
+        if self.state() == QAbstractSocket.ConnectedState:
+            packet = [Commands.emergencyStopPacket, self._packetIdx, 0, 0, {}]
+            self._packetIdx = (self._packetIdx + 1) & 0xffffffff
+            self.write(msgpack.packb(packet))
+        self.failRequests("Emergency stop.")
+
+    def outstanding(self) -> list:
+        # written requests still waiting for their reply
+        return [request for request in self._inflight.values() if not request.done and request.arrived is None]
+
+    @pyqtSlot()
+    def writeRequests(self) -> None:
+        # requests to resend keep their place (already counted in the window)
+        while self._resend:
+            request = self._resend.popleft()
+            if not request.done:
+                self.writeRequest(request)
+        # keep up to requestWindow() requests on the way, the console works through them back to back
+        while self._queue and len(self.outstanding()) < self.requestWindow():
+            request = self._queue.popleft()
+            if request.done:  # cancelled before sending
+                continue
+            self.writeRequest(request)
+            self._inflight[request.packet[1]] = request
+        outstanding = self.outstanding()
+        if outstanding:
+            outstanding[0].watch()
+
+    def requestWindow(self) -> int:
+        # enough requests on the way to hide the latency of the link (once probed), at least self.window
+        window = max(self.window, 1)
+        if self.linkModel is not None and self._queue:
+            window = max(window, self.linkModel.window(self._queue[0].expectedSize))
+        return window
+
+    def writeRequest(self, request: PendingReply) -> None:
+        start = time.perf_counter()
+        packet = list(request.packet)
+        packet[4] = self.encodeSequence(packet[4], request)
+        raw = msgpack.packb(packet)
+        request.encodeTime += time.perf_counter() - start
+        request.bytesSent += len(raw)
+        self.write(raw)
+        request.start()
+
+    @staticmethod
+    def sequenceHash(bytestream) -> str:
+        return hashlib.blake2b(bytestream, digest_size=16).hexdigest()
+
+    def encodeSequence(self, data: dict, request: PendingReply) -> dict:
+        """
+        Replace the program of a packet by its hash or a patch against the program on the console
+        @param data:        packet data
+        @param request:     request of the packet (remembers what was sent)
+        @return:            packet data to write (request keeps the full program for resending)
+        """
+        request.sequenceHash = None
+        request.sentFull = True
+        if not isinstance(data, dict) or Commands.sequenceData not in data:
+            return data
+        program = data[Commands.sequenceData]
+        if not self.dedup:
+            self._consoleProgram = None
+            return data
 
-        while True:
-            buf = self.read(100)
-            if not buf:
+        key = self.sequenceHash(program)
+        data = dict(data)
+        data[Commands.sequenceHash] = key
+        if self._consoleProgram is not None:
+            [baseKey, base] = self._consoleProgram
+            if baseKey == key:
+                del data[Commands.sequenceData]  # console has it already
+            elif len(base) == len(program):
+                # e.g. T-value patch: a few changed instruction words
+                new = np.frombuffer(program, WORD_DTYPE)
+                changed = np.flatnonzero(new != np.frombuffer(base, WORD_DTYPE))
+                if 8 * len(changed) < len(program) // 2:
+                    data[Commands.sequencePatch] = np.column_stack([changed, new[changed]]).astype(WORD_DTYPE).tobytes()
+                    data[Commands.sequenceBase] = baseKey
+                    del data[Commands.sequenceData]
+        request.sequenceHash = key
+        request.sentFull = Commands.sequenceData in data
+        self._consoleProgram = [key, program]  # snapshot, bytestreams are never modified in place
+        return data
+
+    def checkSequence(self, request: PendingReply, reply) -> bool:
+        # false if the console couldn't run the request with the program it holds (request is resent)
+        if request.sequenceHash is None:
+            return True
+        data = reply[4] if isinstance(reply[4], dict) else {}
+        if Commands.sequenceHash not in data:
+            # console doesn't know deduplication, always send the full program
+            self.dedup = False
+            if request.sentFull:
+                return True
+        elif data[Commands.sequenceHash] == request.sequenceHash:
+            return True
+
+        self._consoleProgram = None  # next write sends the full program
+        request.resends += 1
+        if request.resends > 2:
+            request.fail("Console didn't accept the sequence.")
+        else:
+            self._resend.append(request)
+        return False
+
+    @pyqtSlot()
+    def deliverReplies(self) -> None:
+        # hand out replies in the order of the requests, given up requests are skipped
+        while self._inflight:
+            request = next(iter(self._inflight.values()))
+            if request.arrived is None and not request.done:
+                break
+            self._inflight.popitem(last=False)
+            if request.arrived is not None:
+                request.resolve(*request.arrived)
+                self.recordTiming(request)
+        self.writeRequests()
+
+    @pyqtSlot()
+    def readReplies(self) -> None:
+        # everything available in one chunk, decode as soon as a reply is complete
+        self.receive(self.read(self.bytesAvailable()))
+        while self._fill:
+            # the headers tell where the reply ends, the walk goes on where the last chunk ended;
+            # the reply is decoded once, without copying binary fields
+            start = time.perf_counter()
+            received = memoryview(self._buffer)[0:self._fill]
+            self._scan = skipReply(received, *self._scan)
+            [end, pending] = self._scan
+            if pending:
+                self._decodeTime += time.perf_counter() - start
                 break
-            unpacker.feed(buf)
-            for i in unpacker:
-                return i  # quit function after 1st reply
+            [reply, _] = unpackReply(received[0:end])
+            self._decodeTime += time.perf_counter() - start
+            self._scan = [0, 1]
+            rest = self._buffer[end:self._fill]  # start of the next reply, usually empty
+            self._buffer = None
+            self._fill = 0
+            self.matchReply(reply, end, self._decodeTime)
+            self._decodeTime = 0.0
+            self.receive(rest)
+        self.deliverReplies()
+
+    def matchReply(self, reply, size: int, decodeTime: float = 0.0) -> None:
+        if not isinstance(reply, list) or len(reply) < 5:
+            warn("Received malformed reply, dropping it.")
+            return
+        if reply[0] == Commands.emergencyStopPacket:
+            warn("Console reported an emergency stop.")
+            self.failRequests("Emergency stop of the console.")
+            return
+        request = self._inflight.get(reply[1])
+        if request is None:
+            # reply of a request that was given up before (timeout, cancel, emergency stop)
+            print("Dropping reply of packet {}.".format(reply[1]))
+            return
+        request.decodeTime += decodeTime
+        if self.checkSequence(request, reply):
+            request.arrive(reply, size)
+
+    def receive(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._buffer is None:
+            # new reply: allocate for the expected size of the oldest outstanding request
+            outstanding = self.outstanding()
+            expectedSize = outstanding[0].expectedSize + REPLY_OVERHEAD if outstanding else 0
+            self._buffer = bytearray(max(expectedSize, len(data), RECEIVE_BUFFER_SIZE))
+            if outstanding:
+                outstanding[0].firstByteAt = time.perf_counter()
+        if self._fill + len(data) > len(self._buffer):
+            # larger than expected, grow (decoded views may still reference the old buffer)
+            buffer = bytearray(max(2 * len(self._buffer), self._fill + len(data)))
+            buffer[0:self._fill] = memoryview(self._buffer)[0:self._fill]
+            self._buffer = buffer
+        self._buffer[self._fill:self._fill + len(data)] = data
+        self._fill += len(data)
+
+    def recordTiming(self, request: PendingReply) -> None:
+        # times in ms, firstByte and receive of the last write (resends)
+        def ms(start, end):
+            return (end - start) * 1e3 if start is not None and end is not None else None
+        self.wireStats.record(request.packet[1], request.packet[0],
+                              queued=ms(request.createdAt, request.sentAt) if not request.resends else None,
+                              encode=request.encodeTime * 1e3, sent=request.bytesSent,
+                              firstByte=ms(request.sentAt, request.firstByteAt),
+                              receive=ms(request.firstByteAt, request.receivedAt),
+                              decode=request.decodeTime * 1e3, size=request.size,
+                              roundTrip=ms(request.sentAt, request.receivedAt))
+
+    @pyqtSlot()
+    def abortRequests(self) -> None:
+        self.failRequests("Connection to server closed.")
+        self._buffer = None
+        self._fill = 0
+        self._decodeTime = 0.0
+        self._scan = [0, 1]
+
+    def failRequests(self, error: str) -> None:
+        requests = list(self._inflight.values()) + list(self._queue)
+        self._inflight.clear()
+        self._queue.clear()
+        self._resend.clear()
+        self._consoleProgram = None
+        for request in requests:
+            request.fail(error)
 
     def setFrequency(self, f_Ex: float) -> None:
         """
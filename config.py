@@ -2,8 +2,8 @@
 Config File
 
 @author:    Sula Mueller
-@version:   1.0.0
-@change:    02/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary: set some hardcoded variables
 """
@@ -15,9 +15,34 @@ class configvars:
     # sampling time
     timePerSample = 4e-3
 
+    # sequence timing
+    clockCycle = 7  # ns per clock cycle of the sequencer (PR delays)
+    maxAnalyzerSteps = 1000000  # executed instructions after which a sequence counts as not halting
+    communicationTimeout = 1000  # ms to wait for a reply on top of the sequence duration
+    requestWindow = 4  # max. number of requests sent to the console before their replies arrived
+    maxRequestWindow = 16  # upper limit of the window when it grows to hide the latency of a slow link
+    sequenceDedup = True  # console keeps the last program, only send its hash or the changed instruction words
+    acquisitionFormat = 'int16'  # transfer format of acquired data: complex64, int16, float16 or int8 (scaled I/Q)
+    wireStatsSize = 1000  # number of request timings kept (ComMngr.wireStats)
+
+    # FFT of acquired data
+    fftBackend = 'auto'  # pyfftw, scipy, numpy or auto (first one available)
+    fftWorkers = -1  # threads per FFT (-1: all cores)
+    fftZeroFill = False  # zero-fill spectra to the next FFT friendly length (finer frequency bins)
+    smoothingWidth = 50  # samples of the running mean of time domain traces (signalpipeline)
+    peakInterpolation = 'lorentzian'  # sub-bin position of spectral peaks: lorentzian, gaussian (readouts much shorter than T2*), parabolic or none
+    lorentzianFit = False  # refine the peak position by a least squares fit of a Lorentzian line (slower)
+    calibrationSamples = 1000  # samples of the acquisition that centers the frequency (FrequencyManager)
+    calibrationBroadening = 2.0  # exponential line broadening of that acquisition in frequency bins
+
     # rounding to how many digits
     roundToDigits = 4
 
+    # relaxometry
+    hardwareAveraging = False  # let the FPGA repeat the sequence (LOOP_CTR) instead of one request per average
+    singleSubmission = False  # one program and one request for all time values (and averages)
+    recoveryTime = 1000  # delay in ms between two time values of a single submission
+
     # for polynomial fitting
     fitting_overshot = 1.2
     fitting_precision = 100  # multiplyer for number of fit points
@@ -28,6 +53,11 @@ class configvars:
     maxExampleDataval = 0.8  # max Signal
     minExampleDataval = -0.4  # min Signal before absolute
 
+    # assembly cache
+    assemblyCacheSize = 32  # number of assembled programs kept in memory
+    assemblyDiskCache = True  # also keep assembled programs in sequence/.asmcache (precompile: python assembler.py)
+    warmupOperations = True  # assemble operations in background once the main window is shown
+
     # natural constants
     one_over_ln2: float = 1.4427
     one_over_e: float = 0.3679
\ No newline at end of file
@@ -4,21 +4,33 @@ Data Manager
 @author:    David Schote
 @reworked by: Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   1.0.2
-@change:    02/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Class for managing the data procession of acquired data.
             Processes data in time (t_) and frequency (f_) domain.
+            Traces, axes, FFT and the metrics derived from them are computed on first access
+            and cached, each at most once per acquisition.
+            Traces and spectrum come from a signal pipeline (signalpipeline, default:
+            defaultPipeline()), spectra have numBins points (numSamples, more if zero-filled).
+            Peak position and FWHM are interpolated between bins (spectralpeak), centerFrequency
+            gives the peak frequency unrounded.
 """
 
 # system includes
 from PyQt5.QtCore import QObject, pyqtSignal
 from datetime import datetime
 from dataclasses import dataclass
+from functools import cached_property
 import numpy as np
 
 # project includes
 from config import configvars
+from signalpipeline import Pipeline, defaultPipeline
+from spectralpeak import peakPosition, interpolatedFwhm
+
+FWHM_WINDOW = 1000  # default frequency window (in datapoints) around the peak for the FWHM
+SNR_WINDOWFACTOR = 10  # default factor for the FWHM to define the peak window of the SNR
 
 @dataclass(repr=False, eq=False)
 class DataManager(QObject):
@@ -27,20 +39,13 @@ class DataManager(QObject):
     t2_finished = pyqtSignal()
     uploaded = pyqtSignal(bool)
 
-    __slots__ = ['t_magnitude',
-                 't_real',
-                 't_imag',
-                 't_axis',
-                 'f_axis',
-                 'f_fftData',
-                 'f_fftMagnitude']
-
-    def __init__(self, data: np.complex, f_Ex: float, numSamples: int, f_range: int = 250000):
+    def __init__(self, data: np.ndarray, f_Ex: float, numSamples: int, f_range: int = 250000, pipeline: Pipeline = None):
         """
         Initialisation of data manager class
         @param data:        Raw data
         @param numSamples:  number of samples
         @param f_range:     Range of frequency spectrum
+        @param pipeline:    processing of the readout (default: defaultPipeline())
         """
         super(DataManager, self).__init__()
         self.data = data
@@ -48,27 +53,87 @@ class DataManager(QObject):
         self.numSamples = numSamples
         self.f_range = f_range
         self.T_sampling = self.numSamples * configvars.timePerSample  # time axis for plotting
+        self.pipeline = pipeline if pipeline is not None else defaultPipeline()
+        self.frame = self.pipeline.frame(shape=(self.numSamples,)).load(self.data)
+        self.numBins = self.frame.numBins  # length of the spectrum
+
+    @cached_property
+    def d_cropped(self) -> np.ndarray:
+        return self.data[0:self.numSamples]  # crop datastream to specified number of numSamples
+
+    @cached_property
+    def t_axis(self) -> np.ndarray:
+        return np.linspace(0, self.T_sampling, self.numSamples)
+
+    @cached_property
+    def t_magnitude(self) -> np.ndarray:
+        return self.frame.get('magnitude')
+
+    @cached_property
+    def t_magnitudeConvolved(self) -> np.ndarray:
+        return self.frame.get('magnitudeSmoothed')
+
+    @cached_property
+    def t_real(self) -> np.ndarray:
+        return self.frame.get('real')
+
+    @cached_property
+    def t_realConvolved(self) -> np.ndarray:
+        return self.frame.get('realSmoothed')
+
+    @cached_property
+    def t_imag(self) -> np.ndarray:
+        return np.imag(self.d_cropped)
+
+    @cached_property
+    def f_axis(self) -> np.ndarray:
+        return np.linspace(-self.f_range / 2, self.f_range / 2, self.numBins)
+
+    @cached_property
+    def f_fftData(self) -> np.ndarray:
+        return self.frame.get('spectrum')
+
+    @cached_property
+    def f_fftMagnitude(self) -> np.ndarray:
+        return self.frame.get('spectrumMagnitude')
+
+    @cached_property
+    def evaluateable(self) -> bool:
+        return bool(np.ptp(self.f_fftMagnitude) > 1)
+
+    @cached_property
+    def centerFrequency(self) -> float:
+        # frequency of the peak in MHz, interpolated between bins (not rounded)
+        if not self.evaluateable:
+            return float("nan")
+        position = peakPosition(self.f_fftMagnitude, np.argmax(self.f_fftMagnitude))
+        return float(self.f_Ex + ((position - self.numBins / 2) * self.f_range / self.numBins) / 1.0e6)
 
-        d_cropped = self.data[0:self.numSamples]  # crop datastream to specified number of numSamples
-        self.t_axis = np.linspace(0, self.T_sampling, self.numSamples)
-        self.t_magnitude = np.abs(d_cropped)
-        self.t_magnitudeConvolved = np.convolve(self.t_magnitude, np.ones((50,)) / 50, mode='same')
-        self.t_real = np.real(d_cropped)
-        self.t_realConvolved = np.convolve(self.t_real, np.ones((50,)) / 50, mode='same')
-        self.t_imag = np.imag(d_cropped)
-        
-        self.f_axis = np.linspace(-self.f_range / 2, self.f_range / 2, self.numSamples)
-        self.f_fftData = np.fft.fftshift(np.fft.fft(np.fft.fftshift(d_cropped), n=self.numSamples))
-        self.f_fftMagnitude = abs(self.f_fftData)
+    @cached_property
+    def peakparameters(self) -> tuple:
+        if not self.evaluateable:
+            return (float("nan"), float("nan"), 0, float("nan"))
+
+        t_signalValue: float = round(np.max(self.t_magnitudeConvolved), configvars.roundToDigits)
+        f_signalIdx: int = np.argmax(self.f_fftMagnitude)
+        f_signalValue: float = round(float(self.f_fftMagnitude[f_signalIdx]), configvars.roundToDigits)
+        f_signalFrequency: float = round(self.centerFrequency, configvars.roundToDigits)
+        return (f_signalIdx, f_signalValue, f_signalFrequency, t_signalValue)
+
+    @cached_property
+    def fwhm(self) -> tuple:
+        return self.calculate_fwhm(FWHM_WINDOW)
+
+    @cached_property
+    def snr(self) -> float:
+        return self.calculate_snr(SNR_WINDOWFACTOR)
 
     def is_evaluateable(self) -> bool:
         """
         Check if acquired data is evaluateable
         @return:    Evaluateable (true/false)
         """
-        minValue = min(self.f_fftMagnitude)
-        maxValue = max(self.f_fftMagnitude)
-        return (maxValue - minValue) > 1
+        return self.evaluateable
 
     @property
     def get_sign(self) -> int:
@@ -76,56 +141,56 @@ class DataManager(QObject):
         Get sign of real part signal in time domain
         @return:    Sign
         """
-        index: np.ndarray = np.argmin(self.t_realCon[0:self.numSamples])
-        return np.sign(self.t_realCon[index])
+        index: np.ndarray = np.argmin(self.t_realConvolved[0:self.numSamples])
+        return np.sign(self.t_realConvolved[index])
 
     def get_peakparameters(self) -> [float, float, int, float]:
         """
         Get peak parameters
         @return:     index of frequency peak, frequency peak value, frequency of peak, time domain peak value
         """
-        if not self.is_evaluateable():
-            return [float("nan"), float("nan"), 0, float("nan")]
+        return list(self.peakparameters)
 
-        t_signalValue: float = round(np.max(self.t_magnitudeCon), configvars.roundToDigits)
-        f_signalValue: float = round(np.max(self.f_fftMagnitude), configvars.roundToDigits)
-        f_signalIdx: int = np.argmax(self.f_fftMagnitude)
-        f_signalFrequency: float = round(self.f_Ex + ((f_signalIdx - self.numSamples / 2)
-                                                            * self.f_range / self.numSamples) / 1.0e6, configvars.roundToDigits)
-        return [f_signalIdx, f_signalValue, f_signalFrequency, t_signalValue]
-
-    def get_fwhm(self, f_fwhmWindow: int = 1000) -> [int, float, float]:
+    def get_fwhm(self, f_fwhmWindow: int = FWHM_WINDOW) -> [float, float, float]:
         """
         Get full width at half maximum
         @param f_fwhmWindow:    Frequency window
-        @return:                FWHM in datapoint indices, hertz and ppm
-        """
-        if not self.is_evaluateable():
-            return [0, float("nan"), float("nan")]
-
-        [peakIdx, peakValue, peakFreq, _] = self.get_peakparameters()
-        fft_window = self.f_fftMagnitude[int(peakIdx - f_fwhmWindow / 2):int(peakIdx + f_fwhmWindow / 2)]
-        candidates: np.ndarray = np.abs([x - peakValue / 2 for x in fft_window])
-        # Calculate index difference by find indices of minima, calculate fwhm in Hz thereafter
-        winC = int(f_fwhmWindow / 2)
-        fwhm: int = np.argmin(candidates[winC:-1]) + winC - np.argmin(candidates[0:winC])
-        fwhm_hz: float = fwhm * (abs(np.min(self.f_axis)) + abs(np.max(self.f_axis))) / self.numSamples
+        @return:                FWHM in datapoints (interpolated), hertz and ppm
+        """
+        if f_fwhmWindow == FWHM_WINDOW:
+            return list(self.fwhm)
+        return list(self.calculate_fwhm(f_fwhmWindow))
+
+    def calculate_fwhm(self, f_fwhmWindow: int) -> tuple:
+        if not self.evaluateable:
+            return (0, float("nan"), float("nan"))
+
+        [peakIdx, peakValue, peakFreq, _] = self.peakparameters
+        # half maximum crossings within the window, interpolated between bins
+        fwhm: float = float(interpolatedFwhm(self.f_fftMagnitude, peakIdx, peakValue, f_fwhmWindow))
+        if np.isnan(fwhm):  # peak wider than the window
+            fwhm = float(f_fwhmWindow)
+        fwhm_hz: float = fwhm * (abs(self.f_axis[0]) + abs(self.f_axis[-1])) / self.numBins
         fwhm_ppm: float = fwhm_hz / peakFreq
 
-        return [fwhm, fwhm_hz, fwhm_ppm]
+        return (fwhm, fwhm_hz, fwhm_ppm)
 
-    def get_snr(self, f_windowfactor: float = 10) -> float:
+    def get_snr(self, f_windowfactor: float = SNR_WINDOWFACTOR) -> float:
         """
         Get signal to noise ratio
         @param f_windowfactor:  Factor for fwhm to define peak window
-        @param n:               N datapoints for moving average
         @return:                SNR
         """
-        if not self.is_evaluateable():
+        if f_windowfactor == SNR_WINDOWFACTOR:
+            return self.snr
+        return self.calculate_snr(f_windowfactor)
+
+    def calculate_snr(self, f_windowfactor: float) -> float:
+        if not self.evaluateable:
             return float("nan")
 
-        [fwhm, _, _] = self.get_fwhm()
-        [_, peakValue, _, _] = self.get_peakparameters()
+        fwhm = self.fwhm[0]
+        peakValue = self.peakparameters[1]
         peakWindow = int(fwhm * f_windowfactor)
         winC = int(len(self.f_fftData) / 2)
         noiseBorder = int(len(self.f_fftData) * 0.05)
@@ -135,4 +200,147 @@ class DataManager(QObject):
         snr = round(1 / noise)
         return snr
 
+class BatchDataManager:
+    def __init__(self, data: np.ndarray, f_Ex: float, numSamples: int, f_range: int = 250000, pipeline: Pipeline = None):
+        """
+        Data procession of a stack of acquisitions (e.g. averages, time values of a relaxometry),
+        gives the metrics of DataManager for every row with one numpy call along the rows
+        @param data:        Raw data, shape [N, samples] (complex64)
+        @param f_Ex:        excitation frequency in MHz
+        @param numSamples:  number of samples
+        @param f_range:     Range of frequency spectrum
+        @param pipeline:    processing of the readouts (default: defaultPipeline())
+        """
+        self.data = np.atleast_2d(data)
+        self.f_Ex = f_Ex
+        self.numSamples = numSamples
+        self.f_range = f_range
+        self.T_sampling = self.numSamples * configvars.timePerSample
+        self.pipeline = pipeline if pipeline is not None else defaultPipeline()
+        self.frame = self.pipeline.frame(shape=(len(self.data), self.numSamples)).load(self.data)
+        self.numBins = self.frame.numBins
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: int) -> DataManager:
+        # single acquisition (e.g. for plotting)
+        return DataManager(self.data[index], self.f_Ex, self.numSamples, self.f_range, self.pipeline)
+
+    @cached_property
+    def d_cropped(self) -> np.ndarray:
+        return self.data[:, 0:self.numSamples]
+
+    @cached_property
+    def t_axis(self) -> np.ndarray:
+        return np.linspace(0, self.T_sampling, self.numSamples)
+
+    @cached_property
+    def t_magnitude(self) -> np.ndarray:
+        return self.frame.get('magnitude')
+
+    @cached_property
+    def t_magnitudeConvolved(self) -> np.ndarray:
+        return self.frame.get('magnitudeSmoothed')
+
+    @cached_property
+    def f_axis(self) -> np.ndarray:
+        return np.linspace(-self.f_range / 2, self.f_range / 2, self.numBins)
+
+    @cached_property
+    def f_fftData(self) -> np.ndarray:
+        return self.frame.get('spectrum')
+
+    @cached_property
+    def f_fftMagnitude(self) -> np.ndarray:
+        return self.frame.get('spectrumMagnitude')
+
+    @cached_property
+    def evaluateable(self) -> np.ndarray:
+        return np.ptp(self.f_fftMagnitude, axis=1) > 1
+
+    @cached_property
+    def f_signalIdx(self) -> np.ndarray:
+        return np.where(self.evaluateable, np.argmax(self.f_fftMagnitude, axis=1), 0)
 
+    @cached_property
+    def f_signalValue(self) -> np.ndarray:
+        values = np.take_along_axis(self.f_fftMagnitude, self.f_signalIdx[:, np.newaxis], axis=1)[:, 0].astype(float)
+        return np.where(self.evaluateable, np.round(values, configvars.roundToDigits), np.nan)
+
+    @cached_property
+    def centerFrequency(self) -> np.ndarray:
+        # frequency of the peaks in MHz, interpolated between bins (not rounded, nan if not evaluateable)
+        positions = peakPosition(self.f_fftMagnitude, self.f_signalIdx)
+        frequencies = self.f_Ex + ((positions - self.numBins / 2) * self.f_range / self.numBins) / 1.0e6
+        return np.where(self.evaluateable, frequencies, np.nan)
+
+    @cached_property
+    def f_signalFrequency(self) -> np.ndarray:
+        return np.where(self.evaluateable, np.round(self.centerFrequency, configvars.roundToDigits), 0)
+
+    @cached_property
+    def t_signalValue(self) -> np.ndarray:
+        return np.where(self.evaluateable, np.round(np.max(self.t_magnitudeConvolved, axis=1), configvars.roundToDigits), np.nan)
+
+    @cached_property
+    def peakparameters(self) -> tuple:
+        # per row: index of frequency peak, frequency peak value, frequency of peak, time domain peak value
+        return (self.f_signalIdx, self.f_signalValue, self.f_signalFrequency, self.t_signalValue)
+
+    @cached_property
+    def fwhm(self) -> tuple:
+        return self.calculate_fwhm(FWHM_WINDOW)
+
+    @cached_property
+    def snr(self) -> np.ndarray:
+        return self.calculate_snr(SNR_WINDOWFACTOR)
+
+    def calculate_fwhm(self, f_fwhmWindow: int = FWHM_WINDOW) -> tuple:
+        """
+        Full width at half maximum of every row
+        @param f_fwhmWindow:    Frequency window
+        @return:                FWHM in datapoints (interpolated), hertz and ppm (arrays)
+        """
+        fwhm = interpolatedFwhm(self.f_fftMagnitude, self.f_signalIdx, self.f_signalValue, f_fwhmWindow)
+        fwhm = np.where(np.isnan(fwhm), float(f_fwhmWindow), fwhm)  # peak wider than the window
+        fwhm = np.where(self.evaluateable, fwhm, 0.0)
+        fwhm_hz = np.where(self.evaluateable, fwhm * (abs(self.f_axis[0]) + abs(self.f_axis[-1])) / self.numBins, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fwhm_ppm = fwhm_hz / self.f_signalFrequency
+        return (fwhm, fwhm_hz, fwhm_ppm)
+
+    def calculate_snr(self, f_windowfactor: float = SNR_WINDOWFACTOR) -> np.ndarray:
+        """
+        Signal to noise ratio of every row
+        @param f_windowfactor:  Factor for fwhm to define peak window
+        @return:                SNR (array)
+        """
+        n = self.f_fftData.shape[1]
+        peakWindow = np.trunc(self.fwhm[0] * f_windowfactor)
+        winC = int(n / 2)
+        noiseBorder = int(n * 0.05)
+        # noise floor: spectrum without borders, minus the peak window around the center
+        # (window sums from prefix sums over the part of the spectrum the windows cover)
+        lo = np.clip(np.trunc(winC - peakWindow / 2), noiseBorder, n - 1 - noiseBorder).astype(int)
+        hi = np.clip(np.trunc(winC + peakWindow / 2), noiseBorder, n - 1 - noiseBorder).astype(int)
+        hi = np.maximum(hi, lo)
+        floor = slice(noiseBorder, max(n - 1 - noiseBorder, noiseBorder))
+        total = np.sum(self.f_fftData[:, floor], axis=1, dtype=np.complex128)
+        totalSquares = np.sum(np.square(self.f_fftMagnitude[:, floor], dtype=float), axis=1)
+        count = np.full(len(self), floor.stop - floor.start) - (hi - lo)
+        start, stop = lo.min(initial=0), hi.max(initial=0)
+        if stop > start:
+            sums = np.zeros((len(self), stop - start + 1), dtype=np.complex128)
+            np.cumsum(self.f_fftData[:, start:stop], axis=1, out=sums[:, 1:])
+            squares = np.zeros((len(self), stop - start + 1))
+            np.cumsum(np.square(self.f_fftMagnitude[:, start:stop], dtype=float), axis=1, out=squares[:, 1:])
+            rows = np.arange(len(self))
+            total -= sums[rows, hi - start] - sums[rows, lo - start]
+            totalSquares -= squares[rows, hi - start] - squares[rows, lo - start]
+        count = np.maximum(count, 1)
+        # std of the noise floor relative to the peak value
+        variance = np.maximum(totalSquares / count - np.abs(total / count) ** 2, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            noise = np.sqrt(variance) / self.f_signalValue
+            return np.where(self.evaluateable, np.round(1 / noise), np.nan)
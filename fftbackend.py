@@ -0,0 +1,106 @@
+"""
+FFT Backend
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   FFTs of acquired data.
+            Uses pyFFTW if installed (one plan per size, type and axis, kept for reuse),
+            otherwise scipy.fft (keeps complex64, parallel over rows with configvars.fftWorkers),
+            numpy as last resort. With configvars.fftZeroFill, spectra are zero-filled to the next
+            FFT friendly length (e.g. 2000 -> 2000, 50050 -> 50176), same phase as without zero-filling.
+"""
+
+# system includes
+import os
+import numpy as np
+
+# project includes
+from config import configvars
+
+# optional backends
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+BACKENDS = ('pyfftw', 'scipy', 'numpy')
+
+class FFTBackend:
+    def __init__(self, name: str = configvars.fftBackend, workers: int = configvars.fftWorkers):
+        """
+        Initialization of the FFT backend
+        @param name:    'pyfftw', 'scipy', 'numpy' or 'auto' (first one available)
+        @param workers: threads per transform (-1: all cores)
+        @return:        None
+        """
+        available = [backend for backend, module in zip(BACKENDS, (pyfftw, scipy_fft, np)) if module is not None]
+        if name == 'auto':
+            name = available[0]
+        elif name not in available:
+            print("FFT backend {} is not available, using {}.".format(name, available[0]))
+            name = available[0]
+        self.name = name
+        self.workers = workers
+        self._plans: dict = {}  # (kind, shape, dtype, n, axis) -> FFTW object
+
+    def fft(self, x: np.ndarray, n: int = None, axis: int = -1) -> np.ndarray:
+        if self.name == 'pyfftw':
+            return self._planned('fft', x, n, axis)
+        if self.name == 'scipy':
+            return scipy_fft.fft(x, n=n, axis=axis, workers=self.workers)
+        return np.fft.fft(x, n=n, axis=axis)
+
+    def _planned(self, kind: str, x: np.ndarray, n: int, axis: int) -> np.ndarray:
+        key = (kind, x.shape, x.dtype.str, n, axis)
+        plan = self._plans.get(key)
+        if plan is None:
+            threads = self.workers if self.workers > 0 else os.cpu_count()
+            plan = getattr(pyfftw.builders, kind)(pyfftw.empty_aligned(x.shape, x.dtype), n=n, axis=axis,
+                                                  threads=threads, planner_effort='FFTW_MEASURE')
+            self._plans[key] = plan
+        return plan(x).copy()  # the plan reuses its output array
+
+    @staticmethod
+    def fastLength(n: int) -> int:
+        # smallest length >= n the FFT is fast for (factors 2, 3, 5)
+        if scipy_fft is not None:
+            return scipy_fft.next_fast_len(n)
+        length = n
+        while True:
+            m = length
+            for p in (2, 3, 5):
+                while m % p == 0:
+                    m //= p
+            if m == 1:
+                return length
+            length += 1
+
+    def spectrum(self, data: np.ndarray, numSamples: int, numBins: int = None, axis: int = -1) -> np.ndarray:
+        """
+        Centered spectrum of acquired data
+        @param data:        acquired data (complex), transformed along axis
+        @param numSamples:  number of samples
+        @param numBins:     length of the spectrum (> numSamples: zero-filled)
+        @param axis:        axis of the samples
+        @return:            spectrum, zero frequency in the center
+        """
+        if numBins is None or numBins == numSamples:
+            return np.fft.fftshift(self.fft(np.fft.fftshift(data, axes=axis), n=numSamples, axis=axis), axes=axis)
+        # zero-filled: delayed by the same numSamples // 2 as the fftshift above (as linear phase),
+        # so the bins both spectra share have the same phase
+        spectrum = self.fft(data, n=numBins, axis=axis)
+        shape = [1] * spectrum.ndim
+        shape[axis] = numBins
+        ramp = np.exp(-2j * np.pi * (numSamples // 2) * np.arange(numBins) / numBins).astype(spectrum.dtype)
+        spectrum *= ramp.reshape(shape)
+        return np.fft.fftshift(spectrum, axes=axis)
+
+# initialize an instance
+FFT = FFTBackend()
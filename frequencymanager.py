@@ -2,31 +2,50 @@
 Frequency Manager
 
 @author:    Sula Mueller
-@version:   1.0.0
-@change:    12/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Class to center frequency (to current Larmor frequency)
+            Uses the peak interpolated between bins (DataManager.centerFrequency), so a short
+            acquisition of configvars.calibrationSamples samples is enough. Its line is broadened
+            (calibrationPipeline) so the truncated readout still gives a Lorentzian peak.
 """
 
 # system imports
 import numpy as np
 
 # project imports
-from communicationmanager import ComMngr
+from config import configvars
+from communicationmanager import ComMngr, CommunicationManager
 from datamanager import DataManager
 from operationmodes import Spectrum, defaultoperations
+from signalpipeline import Pipeline, Apodization, Spectrum as SpectrumStage, SpectrumMagnitude
 from globalvars import globals
 nmspc = globals.GlobalNamespace
 
+def calibrationPipeline(numSamples: int) -> Pipeline:
+    # exponential apodization of configvars.calibrationBroadening bins, the signal decays within the readout
+    binWidth = 1e3 / configvars.timePerSample / numSamples  # Hz
+    return Pipeline([
+        Apodization('exponential', configvars.calibrationBroadening * binWidth),
+        SpectrumStage(),
+        SpectrumMagnitude()
+    ])
+
 class FrequencyManager:
-    def __init__(self, AcqMngr = None, operation = None):
+    def __init__(self, AcqMngr = None, operation = None, session: CommunicationManager = None):
         self.AcqMngr = AcqMngr
         self.operation = operation
+        # connection to the console: given, of the AcquisitionManager or the default one
+        if session is None:
+            session = getattr(AcqMngr, 'session', None)
+        self.session = session if session is not None else ComMngr
         self.f_Larmor = None
 
         if AcqMngr is not None:
             if hasattr(AcqMngr, 'dataobject'):
-                [_, _, self.f_Larmor, _] = self.AcqMngr.dataobject.get_peakparameters()
+                f_center = self.AcqMngr.dataobject.centerFrequency
+                self.f_Larmor = None if np.isnan(f_center) else f_center
         
         if self.f_Larmor is None:
             self.getLarmor()
@@ -47,27 +66,31 @@ class FrequencyManager:
             self.operation = defaultoperations['FID Spectrum']
             self.f_Ex = self.operation.scanparameters[nmspc.f_Ex][0]
 
-        # do an acquisition
-        packetIdx: int = 0
-        command: int = 0  # 0 equals request a packet
-        version = (1 << 16) | (1 << 8) | 1  # needs a version to work
-        self.numSamples = self.operation.numSamplesPerTimeValue
+        # do a short acquisition (first samples of the readout)
+        numSamples = getattr(self.operation, 'numSamplesPerTimeValue', None) or self.operation.numSamples
+        self.numSamples = min(configvars.calibrationSamples, numSamples)
 
-        tmp_sequence_pack = ComMngr.constructSequencePacket(self.operation)  # uses self.operation.sequencebytestream
-        tmp_scanparam_pack = ComMngr.constructScanParameterPacket(self.operation)  # uses self.operation.scanparameters.f_Ex
-        tmp_package = {**tmp_sequence_pack, **tmp_sequence_pack, **tmp_scanparam_pack}
-        fields = [command, packetIdx, 0, version, tmp_package]
+        tmp_sequence_pack = self.session.constructSequencePacket(self.operation)  # uses self.operation.sequencebytestream
+        [fields, timeout, error] = self.session.constructAcquisitionPacket(self.operation, tmp_sequence_pack, self.numSamples)
+        if error is not None:
+            print("Sequence rejected ({}). Frequency centering abandoned.".format(error))
+            return
 
-        response = ComMngr.sendPacket(fields)
+        request = self.session.sendRequest(fields, timeout, self.session.expectedReplySize(self.numSamples))
+        response = request.wait()
         if response is None:
-            print("Nothing received. Frequency centering abandoned.")
+            print("Nothing received ({}). Frequency centering abandoned.".format(request.error))
             return
 
         # get the actual data
-        tmp_data = np.frombuffer(response[4]['acq'], np.complex64)
+        tmp_data = CommunicationManager.acquiredData(response[4])
         print("Size of received data: {}".format(len(tmp_data)))
-        dataobject: DataManager = DataManager(tmp_data, self.f_Ex, self.numSamples)
-        [_, _, self.f_Larmor, _] = dataobject.get_peakparameters()
+        dataobject: DataManager = DataManager(tmp_data, self.f_Ex, self.numSamples, pipeline=calibrationPipeline(self.numSamples))
+        if not dataobject.is_evaluateable():
+            print("No signal. Frequency centering abandoned.")
+            return
+        self.f_Larmor = dataobject.centerFrequency
+        print("Larmor frequency: {:.6f} MHz".format(self.f_Larmor))
         
         self.setLarmor()
     
@@ -4,8 +4,8 @@ Global Variables and Objects
 @author:    David Schote
 @reworked by: Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   1.0.2
-@change:    02/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Global variables
 """
@@ -18,6 +18,7 @@ class globals:
 
         class SequenceFile:
             def __init__(self, name, path):
+                # parameters (TE, TI...) are annotated in the sequence file, see SequenceDocument
                 self.str = name
                 self.path = path
                 self.get_Tname()
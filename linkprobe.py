@@ -0,0 +1,134 @@
+"""
+Link Probe
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Measures the link to the console with 'test_throughput' requests over a range of
+            array sizes (the console replies with two arrays of that length) and fits
+                round trip = latency + reply size / bandwidth
+            by least squares (LinkModel). Applied to a session, the model extends the timeouts
+            by the transfer time of the expected reply and sizes the request window so the
+            latency is hidden. Qualify a bench network before a long protocol:
+                python linkprobe.py 192.168.1.84
+"""
+
+# system includes
+import math
+import numpy as np
+
+# project includes
+from config import configvars
+from communicationmanager import ComMngr, Commands as cmd, PROTOCOL_VERSION
+
+SIZES = (0, 1 << 8, 1 << 11, 1 << 14, 1 << 17)  # array lengths of the test replies
+TIMEOUT_MARGIN = 2  # timeouts allow this multiple of the modelled transfer time
+
+class LinkModel:
+    def __init__(self, latency: float, bandwidth: float, residual: float = 0.0, points: list = None):
+        """
+        Initialization of a model of the link
+        @param latency:     round trip of an empty reply in ms
+        @param bandwidth:   effective bandwidth in MB/s (inf if not measurable)
+        @param residual:    rms deviation of the measured round trips from the model in ms
+        @param points:      measured [reply size in bytes, round trip in ms]
+        @return:            None
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.residual = residual
+        self.points = points or []
+
+    def transferTime(self, size: int) -> float:
+        # ms for a reply of size bytes
+        return self.latency + size / self.bandwidth / 1e3
+
+    def timeout(self, size: int) -> float:
+        # ms to allow for a reply of size bytes on top of the time the console needs
+        return TIMEOUT_MARGIN * (self.transferTime(size) + self.residual)
+
+    def window(self, size: int, runTime: float = 0.0) -> int:
+        """
+        Number of requests to keep on the way so the console never waits for the next one
+        @param size:        size of each reply in bytes
+        @param runTime:     time the console needs for each request in ms
+        @return:            window (max. configvars.maxRequestWindow)
+        """
+        busy = runTime + size / self.bandwidth / 1e3  # console and link busy with one request
+        if busy <= 0:
+            return configvars.maxRequestWindow
+        return min(1 + math.ceil(self.latency / busy), configvars.maxRequestWindow)
+
+    def __str__(self) -> str:
+        return "latency {:.2f} ms, bandwidth {:.1f} MB/s (rms deviation {:.2f} ms)".format(
+            self.latency, self.bandwidth, self.residual)
+
+def fitLink(sizes, roundTrips) -> LinkModel:
+    """
+    Fit latency and bandwidth to measured round trips
+    @param sizes:       reply sizes in bytes
+    @param roundTrips:  round trips in ms
+    @return:            LinkModel
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    roundTrips = np.asarray(roundTrips, dtype=float)
+    A = np.column_stack([np.ones(len(sizes)), sizes])
+    [[latency, perByte], _, _, _] = np.linalg.lstsq(A, roundTrips, rcond=None)
+    if perByte <= 0:  # sizes too small to see the bandwidth
+        latency = float(np.mean(roundTrips))
+        perByte = 0.0
+    residual = float(np.sqrt(np.mean((A @ [latency, perByte] - roundTrips) ** 2)))
+    bandwidth = 1 / perByte / 1e3 if perByte > 0 else math.inf
+    return LinkModel(max(float(latency), 0.0), bandwidth, residual, np.column_stack([sizes, roundTrips]).tolist())
+
+def probeLink(session=None, sizes=SIZES, repeats: int = 3, apply: bool = True) -> LinkModel:
+    """
+    Measure the link of a session, requests are sent one at a time
+    @param session:     connection to the console (default: ComMngr)
+    @param sizes:       array lengths of the test replies
+    @param repeats:     requests per size (the fastest counts)
+    @param apply:       use the model for the timeouts and the window of the session
+    @return:            LinkModel (None if the console didn't answer)
+    """
+    session = session if session is not None else ComMngr
+    session.linkModel = None  # measure without the model of an earlier probe
+    replySizes = []
+    roundTrips = []
+    session.sendPacket([cmd.requestPacket, 0, 0, PROTOCOL_VERSION, {cmd.testRxThroughput: 0}])  # warm up
+    for n in sizes:
+        best = None
+        for _ in range(repeats):
+            request = session.sendRequest([cmd.requestPacket, 0, 0, PROTOCOL_VERSION, {cmd.testRxThroughput: int(n)}],
+                                          configvars.communicationTimeout + n // 100, 14 * int(n))
+            if request.wait() is None:
+                print("Link probe: no reply for size {} ({}).".format(n, request.error))
+                return None
+            # decoding is client side, not part of the link
+            roundTrip = (request.receivedAt - request.sentAt - request.decodeTime) * 1e3
+            best = roundTrip if best is None else min(best, roundTrip)
+        replySizes.append(request.size)
+        roundTrips.append(best)
+        print("   {:>9d} bytes: {:8.2f} ms".format(request.size, best))
+
+    model = fitLink(replySizes, roundTrips)
+    print("Link: " + str(model))
+    if apply:
+        session.linkModel = model
+    return model
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    from PyQt5.QtCore import QCoreApplication
+
+    parser = argparse.ArgumentParser(description='Measure latency and bandwidth of the link to the console')
+    parser.add_argument('IP', help='IP address of the console')
+    parser.add_argument('--port', type=int, default=1001)
+    parser.add_argument('--repeats', type=int, default=3, help='requests per size')
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    if ComMngr.connectClient(args.IP, args.port):
+        probeLink(ComMngr, repeats=args.repeats)
+        ComMngr.disconnectClient()
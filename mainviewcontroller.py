@@ -4,8 +4,8 @@ Main View Controller
 @author:    David Schote
 @reworked by: Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   2.0.2
-@change:    02/11/2020
+@version:   2.1.0
+@change:    17/10/2026
 """
 
 # system includes
@@ -20,7 +20,7 @@ from operationmanager import OperationManager
 from controller.connectiondialog import ConnectionDialog
 from controller.outputparametercontroller import Output
 from globalvars import globals
-from communicationmanager import ComMngr
+from sessionmanager import SessMngr
 
 style = globals.StyleSheets
 MainWindow_Form, MainWindow_Base = loadUiType('view/mainview.ui')
@@ -104,6 +104,6 @@ class MainViewController(MainWindow_Base, MainWindow_Form):
         Overloaded close function
         @param event:   Close event
         """
-        # Disconnect server connection on closed before accepting the event
-        ComMngr.disconnectClient()
+        # Disconnect all server connections on closed before accepting the event
+        SessMngr.disconnectAll()
         event.accept()
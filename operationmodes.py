@@ -4,29 +4,110 @@ Operation Modes
 @author:    David Schote
 @reworked and extended by : Sula Mueller
 @contact:   david.schote@ovgu.de
-@version:   2.0.2
-@change:    02/11/2020
+@version:   2.1.0
+@change:    17/10/2026
 """
 
 # system imports
+import threading
 from warnings import warn
 
 # project imports
 from globalvars import globals
-from assembler import Assembler
+from config import configvars
+from sequencedocument import loadDocument
+from sequenceanalyzer import analyze
 from communicationmanager import Commands as cmd
+from signalpipeline import Pipeline
 
 nmspc = globals.GlobalNamespace
 seq = globals.Sequences
 relaxtyp = globals.RelaxationTypes
 
-class Spectrum:
+_loadlock = threading.Lock()  # operations may be warmed up from a background thread
+
+def readoutStarts(document, numReadouts: int) -> list:
+    """
+    Positions of the readouts in the data acquired by a program. The receiver also records
+    outside of the readout window (e.g. during blanking leads), so the readouts are found
+    from the timing of the program, not from the length of the window.
+    @param document:    SequenceDocument of the program
+    @param numReadouts: readouts the program acquires (repetitions, time values)
+    @return:            index of the first sample of every window annotated as @readout
+                        (start of every repetition if there's no annotation)
+    """
+    timing = analyze(bytes(document.bytestream))
+    if document.has('readout'):
+        addresses = {target[0] for target in document.slots['readout'].targets}
+        starts = [sample for address, sample in timing.readoutStarts if address in addresses]
+        if len(starts) == numReadouts:
+            return starts
+        warn("Sequence runs {} readout windows, expected {}.".format(len(starts), numReadouts))
+    samplesPerRepetition = timing.readoutSamples // max(numReadouts, 1)
+    return [k * samplesPerRepetition for k in range(numReadouts)]
+
+class SequenceOperation:
+    # sequence of an operation, shared by Spectrum and Relaxometer
+    def __init__(self, sequencefile: seq.SequenceFile = None):
+        """
+        Initialization of the sequence of an operation
+        @param sequencefile:    given sequence
+        @return:                None
+        """
+        self.sequencefile = sequencefile
+        self._document = None  # own copy of the sequence, loaded on first use
+
+    def reloadSequence(self) -> None:
+        # read the sequence file again (e.g. after it was edited)
+        self._document = loadDocument(self.sequencefile.path, reload=True)
+        print("Updated assembler.")
+
+    def setTimeValue(self, T_val) -> None:
+        # set time value (TE/TI) in the sequence document, only patches the bytestream if changed
+        if not self.document.has(self.sequencefile.T_name):
+            warn("SetTimeValue is not implemented for this sequence type.")
+            return
+        self.document.set(self.sequencefile.T_name, T_val)
+
+    @property
+    def document(self):
+        # sequence is only read and assembled when first needed
+        with _loadlock:
+            if self._document is None:
+                self._document = loadDocument(self.sequencefile.path)
+            return self._document
+
+    @property
+    def sequencebytestream(self) -> memoryview:
+        return self.document.bytestream
+
+    def setRepetitions(self, numRepetitions: int) -> None:
+        # number of times the FPGA runs the sequence (LOOP_CTR), readouts are returned back to back
+        if self.document.has('LOOP_CTR'):
+            self.document.set('LOOP_CTR', int(numRepetitions))
+        elif numRepetitions > 1:
+            warn("Sequence has no LOOP_CTR, can't repeat it.")
+
+    def readoutStarts(self) -> list:
+        # first sample of every repetition's readout in the acquired data (see readoutStarts)
+        numRepetitions = self.document.get('LOOP_CTR') if self.document.has('LOOP_CTR') else 1
+        return readoutStarts(self.document, numRepetitions)
+
+    @property
+    def sequence(self):
+        return{
+            nmspc.sequencefile: [self.sequencefile, nmspc.sequencefile, cmd.sequenceData],
+            nmspc.sequencebytestream: [self.sequencebytestream, nmspc.sequencebytestream, cmd.sequenceData]
+        }
+
+class Spectrum(SequenceOperation):
     def __init__(self,
                  sequencefile: seq.SequenceFile = None,
                  f_Ex: float = None,
                  T_val: int = None,
                  numSamples: int = 2000,
-                 shim: list = None):
+                 shim: list = None,
+                 pipeline: Pipeline = None):
         """
         Initialization of spectrum operation class
         @param sequencefile:    given sequence
@@ -34,6 +115,7 @@ class Spectrum:
         @param T_val:           time value (TE, TI...)
         @param numSamples:      number of samples to be acquired
         @param shim:            Shim values for operation
+        @param pipeline:        processing of the readouts (default: defaultPipeline())
         @return:                None
         """
         # make sure, shim is a len=4 array
@@ -46,12 +128,12 @@ class Spectrum:
         self.f_Ex: float = f_Ex
         self.T_val: int = T_val
         self.numSamples: int = numSamples
-        self.sequencefile = sequencefile
-        self.sequencebytestream = Assembler().assemble(self.sequencefile.path)
+        super().__init__(sequencefile)
         self.shim_x: int = shim[0]
         self.shim_y: int = shim[1]
         self.shim_z: int = shim[2]
         self.shim_z2: int = shim[3]
+        self.pipeline = pipeline
 
     # scanparameters will be shown and can be modified on the GUI
     @property
@@ -72,15 +154,8 @@ class Spectrum:
         elif key == self.sequencefile.T_name:
             self.T_val = value
         elif key == nmspc.sequencebytestream:
-            self.sequencebytestream = Assembler().assemble(self.sequencefile.path)
-            print("Updated assembler.")
-    
-    @property
-    def sequence(self):
-        return{
-            nmspc.sequencefile: [self.sequencefile, nmspc.sequencefile, cmd.sequenceData],
-            nmspc.sequencebytestream: [self.sequencebytestream, nmspc.sequencebytestream, cmd.sequenceData]
-        }
+            self.reloadSequence()
+
 
     @property
     def gradientshims(self):
@@ -90,7 +165,7 @@ class Spectrum:
             nmspc.G_z: [self.shim_z, 'shim_z', cmd.gradientOffsetZ]
         }
 
-class Relaxometer:
+class Relaxometer(SequenceOperation):
     def __init__(self,
                  sequencefile: seq.SequenceFile = None,
                  relaxationtype: relaxtyp = None,
@@ -99,7 +174,11 @@ class Relaxometer:
                  Tval_max: int = None,
                  numTimeValues = 20,
                  numSamplesPerTimeValue: int = 2000,
-                 numAveragesPerTimeValue: int = 5):
+                 numAveragesPerTimeValue: int = 5,
+                 hardwareAveraging: bool = configvars.hardwareAveraging,
+                 singleSubmission: bool = configvars.singleSubmission,
+                 recoveryTime: float = configvars.recoveryTime,
+                 pipeline: Pipeline = None):
         """
         Initialization of spectrum operation class
         @param sequencefile:    given sequence
@@ -110,12 +189,15 @@ class Relaxometer:
         @param numTimeValues:   number of time values (TI, TE) to be measured
         @param numSamplesPTV:   sample size for each T_val
         @param numAveragesPTV:  number of measurements for each T_val (get averaged)
+        @param hardwareAveraging: repeat sequence on FPGA, all averages of a T_val in one request
+        @param singleSubmission: one program for all T_vals (and averages), one request
+        @param recoveryTime:    delay between T_vals of a single submission in ms
+        @param pipeline:        processing of the readouts (default: defaultPipeline())
         @return:                None
         """
 
         # set class variables
-        self.sequencefile = sequencefile
-        self.sequencebytestream = Assembler().assemble(self.sequencefile.path)
+        super().__init__(sequencefile)
         self.relaxationtype = relaxationtype
         self.f_Ex: float = f_Ex
         self.numTimeValues: int = numTimeValues
@@ -123,6 +205,10 @@ class Relaxometer:
         self.numAveragesPerTimeValue: int = numAveragesPerTimeValue
         self.tval_min: int = Tval_min
         self.tval_max: int = Tval_max
+        self.hardwareAveraging: bool = hardwareAveraging
+        self.singleSubmission: bool = singleSubmission
+        self.recoveryTime: float = recoveryTime
+        self.pipeline = pipeline
 
     @property
     def scanparameters(self) -> dict:
@@ -149,15 +235,12 @@ class Relaxometer:
         elif key == self.sequencefile.T_name + '_max':
             self.tval_max = value
         elif key == nmspc.sequencebytestream:
-            self.sequencebytestream = Assembler().assemble(self.sequencefile.path)
-            print("Updated assembler.")
-    
-    @property
-    def sequence(self):
-        return{
-            nmspc.sequencefile: [self.sequencefile, nmspc.sequencefile, cmd.sequenceData],
-            nmspc.sequencebytestream: [self.sequencebytestream, nmspc.sequencebytestream, cmd.sequenceData]
-        }
+            self.reloadSequence()
+
+
+    def sweepDocument(self, T_vals: list):
+        # one program running the sequence for all time values back to back (LOOP_CTR repeats all)
+        return self.document.unroll(self.sequencefile.T_name, T_vals, self.recoveryTime)
 
 
 # Definition of default operations
@@ -172,3 +255,20 @@ defaultoperations = {
     'T1 Relaxometry': Relaxometer(seq.IR, relaxtyp.T1, f_Ex_default, T_min_default, T_max_default),
     'T2 Relaxometry': Relaxometer(seq.SE, relaxtyp.T2, f_Ex_default, T_min_default, T_max_default)
 }
+
+def warmupOperations(operations: dict = None) -> threading.Thread:
+    """
+    Load and assemble the sequences of operations in a background thread
+    @param operations:  operations to warm up (default: defaultoperations)
+    @return:            started thread
+    """
+    if operations is None:
+        operations = defaultoperations
+
+    def warmup():
+        for operation in list(operations.values()):
+            _ = operation.sequencebytestream
+
+    thread = threading.Thread(target=warmup, name='warmupOperations', daemon=True)
+    thread.start()
+    return thread
@@ -2,8 +2,8 @@
 Relaxometer Manager
 
 @author:    Sula Mueller
-@version:   1.0.0
-@change:    06/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Class for relaxometry
 """
@@ -18,19 +18,20 @@ from scipy.optimize import curve_fit, brentq
 # project includes
 from globalvars import globals
 from config import configvars as config
-from communicationmanager import ComMngr
-from datamanager import DataManager
-from timevaluemanager import TimeValueManager 
+from communicationmanager import CommunicationManager
+from datamanager import BatchDataManager
 
 nmspc = globals.GlobalNamespace
 relaxtyp = globals.RelaxationTypes
 
 class RelaxometerManager(QObject):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, session: CommunicationManager = None):
          # @param parent:  AcquisitionManager
+         # @param session: connection to the console (default: session of the AcquisitionManager)
 
         super(RelaxometerManager, self).__init__(parent)
         self.parent = parent
+        self.session = session if session is not None else parent.session
 
         # get measurement parameters
         self.relaxationtype = parent.operation.relaxationtype  # T1 or T2
@@ -72,22 +73,64 @@ class RelaxometerManager(QObject):
         self.T_vals = [int(t) for t in self.T_vals]
 
     def doAllMeasurements(self):
+        if self.parent.operation.singleSubmission:
+            self.doSweepMeasurement()
+            return
         successful = True
         self.datavals = []
+        # queue the requests of all time values, the console works through them while replies are evaluated
+        submitted = []
         for T_val in self.T_vals:
+            if self.parent.operation.hardwareAveraging:
+                # FPGA repeats the sequence, one request for all averages
+                submitted.append([self.parent.submitAcquisition(T_val, self.numAveragesPerTimeValue, self.session)])
+            else:
+                submitted.append([self.parent.submitAcquisition(T_val, 1, self.session) for _ in range(0, self.numAveragesPerTimeValue)])
+        # readouts of all time values in one block, [T_val][average]
+        numAverages = self.numAveragesPerTimeValue
+        readouts = np.zeros((self.numTimeValues * numAverages, self.parent.numSamples), np.complex64)
+        received = np.zeros(len(readouts), dtype=bool)
+        for idx, (T_val, requests) in enumerate(zip(self.T_vals, submitted)):
             self.parent.parent.OpMngr.setOutput("...measuring " + self.parent.operation.sequencefile.T_name + " = " + str(int(T_val)) + "ms")
-            av = 0
-            for _ in range(0, self.numAveragesPerTimeValue):
-                self.parent.runAcquisition(T_val)
-                if self.parent.haveResult is False:
+            row = idx * numAverages
+            for request in requests:
+                data = self.parent.collectReadouts(request)
+                if data is None:
                     successful = False
                     continue
-                av = av + round(self.parent.dataobject.get_peakparameters()[3], config.roundToDigits)
-            av = round(av / self.numAveragesPerTimeValue, config.roundToDigits)
-            self.datavals.append(av)
+                n = min(len(data), (idx + 1) * numAverages - row)
+                readouts[row:row + n, 0:data.shape[1]] = data[0:n]
+                received[row:row + n] = True
+                row += n
+        # all time values and averages evaluated at once
+        if received.any():
+            batch = BatchDataManager(readouts, self.parent.f_Ex, self.parent.numSamples, pipeline=self.parent.operation.pipeline)
+            self.parent.batch = batch
+            self.parent.dataobject = batch[int(np.flatnonzero(received)[-1])]
+            peaks = np.where(received, batch.t_signalValue, 0).reshape(self.numTimeValues, numAverages).sum(axis=1)
+            counts = received.reshape(self.numTimeValues, numAverages).sum(axis=1)
+            self.datavals = [round(float(peak / count), config.roundToDigits) if count else 0 for peak, count in zip(peaks, counts)]
+        else:
+            self.datavals = [0] * self.numTimeValues
+        if self.parent.operation.hardwareAveraging:
+            self.parent.operation.setRepetitions(1)
         if not successful:
             self.getExampleData()
     
+    def doSweepMeasurement(self):
+        # all time values (and averages) in one program and one request
+        self.parent.parent.OpMngr.setOutput("...measuring " + str(self.numTimeValues) + " " + self.parent.operation.sequencefile.T_name + "s in one run")
+        self.datavals = [0] * self.numTimeValues
+        self.parent.runSweep(self.T_vals, self.numAveragesPerTimeValue, self.session)
+        if self.parent.haveResult is False:
+            self.getExampleData()
+            return
+        # readouts are ordered [average][T_val]
+        numRuns = max(len(self.parent.batch) // self.numTimeValues, 1)
+        peaks = self.parent.batch.t_signalValue[0:numRuns * self.numTimeValues]
+        peaks = peaks.reshape(numRuns, -1).mean(axis=0)
+        self.datavals[0:len(peaks)] = [round(av, config.roundToDigits) for av in peaks]
+
     def getRandomValue(self, minVal, maxVal):
         valrange = maxVal - minVal
         val = valrange*np.random.random_sample() + minVal
@@ -0,0 +1,197 @@
+"""
+Reply Decoder
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Decoder for msgpack replies of the server that doesn't copy binary fields.
+            Binary fields (e.g. 'acq') are returned as memoryviews into the receive buffer,
+            so they can be handed to numpy without another copy.
+            skipReply() finds the end of a reply from its headers alone and resumes where it
+            stopped, so a reply arriving in many chunks is walked once in total.
+"""
+
+# system includes
+import struct
+import numpy as np
+from msgpack import ExtType
+
+class IncompleteReply(Exception):
+    pass
+
+# formats of fixed size values (type byte -> struct format)
+_scalars = {
+    0xca: '>f', 0xcb: '>d',
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'
+}
+# lengths of str/bin/ext/array/map (type byte -> struct format of the length)
+_lengths = {
+    0xc4: '>B', 0xc5: '>H', 0xc6: '>I',  # bin
+    0xc7: '>B', 0xc8: '>H', 0xc9: '>I',  # ext
+    0xd9: '>B', 0xda: '>H', 0xdb: '>I',  # str
+    0xdc: '>H', 0xdd: '>I',  # array
+    0xde: '>H', 0xdf: '>I'  # map
+}
+_fixext = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16}
+_scalarSizes = {b: struct.calcsize(fmt) for b, fmt in _scalars.items()}
+# objects of fixed size (type byte -> size including the type byte): fixint, nil, bool, numbers
+_fixedSizes = {**{b: 1 for b in [*range(0x80), *range(0xe0, 0x100), 0xc0, 0xc2, 0xc3]},
+               **{b: 1 + size for b, size in _scalarSizes.items()}}
+
+def _read(buf: memoryview, pos: int, fmt: str) -> list:
+    size = struct.calcsize(fmt)
+    if pos + size > len(buf):
+        raise IncompleteReply
+    return [struct.unpack_from(fmt, buf, pos)[0], pos + size]
+
+def _take(buf: memoryview, pos: int, size: int) -> list:
+    if pos + size > len(buf):
+        raise IncompleteReply
+    return [buf[pos:pos + size], pos + size]
+
+def unpackReply(buf, pos: int = 0) -> list:
+    """
+    Decode one msgpack object
+    @param buf:     receive buffer (bytes-like)
+    @param pos:     start of the object in the buffer
+    @return:        [object, end of the object in the buffer]
+    @raise:         IncompleteReply if the buffer ends before the object
+    """
+    buf = memoryview(buf).cast('B') if not isinstance(buf, memoryview) else buf
+    if pos >= len(buf):
+        raise IncompleteReply
+    b = buf[pos]
+    pos += 1
+
+    if b <= 0x7f:
+        return [b, pos]
+    if b >= 0xe0:
+        return [b - 0x100, pos]
+    if b <= 0x8f:
+        return _unpackMap(buf, pos, b & 0x0f)
+    if b <= 0x9f:
+        return _unpackArray(buf, pos, b & 0x0f)
+    if b <= 0xbf:
+        [raw, pos] = _take(buf, pos, b & 0x1f)
+        return [str(raw, 'utf-8'), pos]
+    if b == 0xc0:
+        return [None, pos]
+    if b == 0xc2:
+        return [False, pos]
+    if b == 0xc3:
+        return [True, pos]
+    if b in _scalars:
+        return _read(buf, pos, _scalars[b])
+    if b in _fixext:
+        [code, pos] = _read(buf, pos, '>b')
+        [raw, pos] = _take(buf, pos, _fixext[b])
+        return [ExtType(code, bytes(raw)), pos]
+    if b not in _lengths:
+        raise ValueError("Invalid msgpack type 0x{:02x}.".format(b))
+
+    [n, pos] = _read(buf, pos, _lengths[b])
+    if b <= 0xc6:
+        return _take(buf, pos, n)  # bin: view, no copy
+    if b <= 0xc9:
+        [code, pos] = _read(buf, pos, '>b')
+        [raw, pos] = _take(buf, pos, n)
+        return [ExtType(code, bytes(raw)), pos]
+    if b <= 0xdb:
+        [raw, pos] = _take(buf, pos, n)
+        return [str(raw, 'utf-8'), pos]
+    if b <= 0xdd:
+        return _unpackArray(buf, pos, n)
+    return _unpackMap(buf, pos, n)
+
+def _unpackArray(buf: memoryview, pos: int, n: int) -> list:
+    items = []
+    for _ in range(n):
+        [item, pos] = unpackReply(buf, pos)
+        items.append(item)
+    return [items, pos]
+
+def _unpackMap(buf: memoryview, pos: int, n: int) -> list:
+    items = {}
+    for _ in range(n):
+        [key, pos] = unpackReply(buf, pos)
+        [value, pos] = unpackReply(buf, pos)
+        items[bytes(key) if isinstance(key, memoryview) else key] = value
+    return [items, pos]
+
+def _skip(buf: memoryview, pos: int) -> list:
+    # skip one object without its items: [end of the object (header only for array/map), number of items]
+    if pos >= len(buf):
+        raise IncompleteReply
+    b = buf[pos]
+    pos += 1
+    if b <= 0x7f or b >= 0xe0 or b in (0xc0, 0xc2, 0xc3):
+        return [pos, 0]
+    if b <= 0x8f:
+        return [pos, 2 * (b & 0x0f)]
+    if b <= 0x9f:
+        return [pos, b & 0x0f]
+    if b <= 0xbf:
+        size = b & 0x1f
+    elif b in _scalarSizes:
+        size = _scalarSizes[b]
+    elif b in _fixext:
+        size = 1 + _fixext[b]
+    elif b in _lengths:
+        [n, pos] = _read(buf, pos, _lengths[b])
+        if b in (0xdc, 0xdd):
+            return [pos, n]
+        if b in (0xde, 0xdf):
+            return [pos, 2 * n]
+        size = n + 1 if b in (0xc7, 0xc8, 0xc9) else n  # ext: type byte
+    else:
+        raise ValueError("Invalid msgpack type 0x{:02x}.".format(b))
+    if pos + size > len(buf):
+        raise IncompleteReply
+    return [pos + size, 0]
+
+def _sameKind(b: int, c: int) -> bool:
+    # positive and negative fixints count as one type each
+    return b == c or (b <= 0x7f and c <= 0x7f) or (b >= 0xe0 and c >= 0xe0)
+
+def _skipRun(data: np.ndarray, pos: int, size: int, limit: int) -> list:
+    # skip objects of the type at pos and the same size (e.g. items of an array of numbers)
+    n = min(limit, (len(data) - pos) // size)
+    types = data[pos:pos + n * size:size]
+    b = int(types[0])
+    if b <= 0x7f:
+        same = types <= 0x7f
+    elif b >= 0xe0:
+        same = types >= 0xe0
+    else:
+        same = types == b
+    count = n if same.all() else int(np.argmin(same))
+    return [pos + count * size, count]
+
+def skipReply(buf, pos: int = 0, pending: int = 1) -> list:
+    """
+    Find the end of a msgpack object from its headers, without decoding it
+    @param buf:     receive buffer (bytes-like), may end inside the object
+    @param pos:     position of the next object to skip
+    @param pending: objects left to skip (items of arrays and maps count as objects)
+    @return:        [position reached, objects left], objects left is 0 once the end is found,
+                    otherwise the walk continues from there when more data arrived
+    """
+    buf = memoryview(buf).cast('B') if not isinstance(buf, memoryview) else buf
+    data = np.frombuffer(buf, np.uint8)
+    while pending:
+        size = _fixedSizes.get(buf[pos]) if pos < len(buf) else None
+        if size is not None and pending > 1 and pos + size < len(buf) and _sameKind(buf[pos], buf[pos + size]):
+            # a run of numbers is skipped at once
+            [pos, count] = _skipRun(data, pos, size, pending)
+            pending -= count
+            if count:
+                continue
+        try:
+            [end, items] = _skip(buf, pos)
+        except IncompleteReply:
+            break
+        pos = end
+        pending += items - 1
+    return [pos, pending]
@@ -0,0 +1,179 @@
+"""
+Sequence Analyzer
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Disassembler and static timing analyzer for assembled sequence bytestreams.
+            Runs the program like the FPGA would (registers, LD64, DEC/INC, J/JNZ loops) and
+            adds up the PR delays in clock cycles to get the duration of the program, the
+            receive windows (readout samples) and the RF duty cycle.
+            readoutStarts tells where in the acquired data every PR with the receiver on
+            begins (e.g. the @readout window of each repetition).
+"""
+
+# system includes
+import numpy as np
+from functools import lru_cache
+
+# project includes
+from config import configvars
+from assembler import Assembler, CMD_DTYPE, OPCODE_SHIFT, REG_SHIFT_A, REG_SHIFT_B, REG_MASK, ADDR_MASK, CONST_MASK
+
+_asm = Assembler()
+opcodes: dict = {int(entry[0], 2): name for name, entry in _asm.opcode_table.items()}
+TX_PULSE = int(_asm.bit_table['TX_PULSE'], 16)
+RX_PULSE = int(_asm.bit_table['RX_PULSE'], 16)  # inverted logic: receiver is on while not set
+
+class Instruction:
+    def __init__(self, address: int, cmd: int):
+        """
+        Decoded 64-bit instruction
+        @param address:     address (instruction index) in the program
+        @param cmd:         64-bit command
+        @return:            None
+        """
+        self.address = address
+        self.cmd = cmd
+        self.name = opcodes.get(cmd >> OPCODE_SHIFT, '???')
+        fmt = _asm.opcode_table[self.name][1:2] if self.name in _asm.opcode_table else []
+        if fmt == ['B']:
+            self.reg = (cmd >> REG_SHIFT_B) & REG_MASK
+            self.arg = cmd & CONST_MASK
+        else:
+            self.reg = (cmd >> REG_SHIFT_A) & REG_MASK
+            self.arg = cmd & ADDR_MASK
+
+    def __str__(self) -> str:
+        if self.name in ['NOP', 'HALT']:
+            args = ''
+        elif self.name in ['LD64', 'JNZ']:
+            args = '{}, {}'.format(self.reg, hex(self.arg))
+        elif self.name in ['DEC', 'INC']:
+            args = str(self.reg)
+        elif self.name == 'PR':
+            args = '{}, {} cycles'.format(self.reg, self.arg)
+        elif self.name in ['TXOFFSET', 'GRADOFFSET']:
+            args = str(self.arg)
+        else:
+            args = hex(self.arg)
+        return 'A[{}]\t{} {}\t// {}'.format(hex(self.address), self.name, args, hex(self.cmd))
+
+def commands(bytestream) -> np.ndarray:
+    # 64-bit commands of a bytestream (or buffer of 32-bit words)
+    return np.frombuffer(bytestream, CMD_DTYPE)
+
+def disassemble(bytestream) -> list:
+    """
+    Decode all words of a program (variables decode as instructions as well)
+    @param bytestream:  assembled program
+    @return:            list of Instruction
+    """
+    return [Instruction(address, cmd) for address, cmd in enumerate(commands(bytestream).tolist())]
+
+class SequenceTiming:
+    def __init__(self):
+        self.duration: float = 0  # ms
+        self.rfTime: float = 0  # ms with TX_PULSE set
+        self.rfPulses: list = []  # [start, duration] in ms with TX_PULSE set
+        self.readoutWindows: list = []  # [start, duration] in ms with receiver on
+        self.readoutStarts: list = []  # [address, first sample] of every PR executed with receiver on
+        self.numExecuted: int = 0  # executed instructions
+        self.errors: list = []
+
+    @property
+    def readoutTime(self) -> float:
+        return sum(window[1] for window in self.readoutWindows)
+
+    @property
+    def readoutSamples(self) -> int:
+        return int(round(self.readoutTime / configvars.timePerSample))
+
+    @property
+    def dutyCycle(self) -> float:
+        # fraction of the program time the RF pulse is on
+        return self.rfTime / self.duration if self.duration > 0 else 0
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    def __str__(self) -> str:
+        return "duration = {:.3f} ms, readout samples = {}, RF duty cycle = {:.4%}, {} instructions executed{}".format(
+            self.duration, self.readoutSamples, self.dutyCycle, self.numExecuted,
+            ''.join('\n   ERROR: ' + e for e in self.errors))
+
+@lru_cache(maxsize=32)
+def analyze(bytestream: bytes, maxSteps: int = configvars.maxAnalyzerSteps) -> SequenceTiming:
+    """
+    Run the program statically and get its timing
+    @param bytestream:  assembled program
+    @param maxSteps:    number of executed instructions after which the program counts as not halting
+    @return:            SequenceTiming
+    """
+    timing = SequenceTiming()
+    cmds = commands(bytestream).tolist()
+    if not cmds:
+        timing.errors.append("Empty program.")
+        return timing
+    cycle = configvars.clockCycle * 1e-6  # ms
+    registers = [0] * (REG_MASK + 1)
+    pc = 0
+    time = 0.0
+    rxOn = False
+    txOn = False
+    rxTime = 0.0  # ms with receiver on so far
+    while True:
+        if pc >= len(cmds):
+            timing.errors.append("Program counter {} runs past the end of the program.".format(hex(pc)))
+            break
+        if timing.numExecuted >= maxSteps:
+            timing.errors.append("Program does not halt within {} instructions.".format(maxSteps))
+            break
+        instruction = Instruction(pc, cmds[pc])
+        timing.numExecuted += 1
+        pc += 1
+        name = instruction.name
+        if name == 'HALT':
+            break
+        elif name == 'PR':
+            delay = instruction.arg * cycle
+            output = registers[instruction.reg]
+            if output & TX_PULSE:
+                timing.rfTime += delay
+                if txOn:
+                    timing.rfPulses[-1][1] += delay
+                else:
+                    timing.rfPulses.append([time, delay])
+            txOn = bool(output & TX_PULSE)
+            if not output & RX_PULSE:  # receiver on
+                timing.readoutStarts.append([instruction.address, int(round(rxTime / configvars.timePerSample))])
+                rxTime += delay
+                if rxOn:  # extend current window
+                    timing.readoutWindows[-1][1] += delay
+                else:
+                    timing.readoutWindows.append([time, delay])
+            rxOn = not output & RX_PULSE
+            time += delay
+            continue
+        elif name == 'LD64':
+            if instruction.arg >= len(cmds):
+                timing.errors.append("LD64 at {} loads from {} outside of the program.".format(hex(instruction.address), hex(instruction.arg)))
+                break
+            registers[instruction.reg] = cmds[instruction.arg]
+        elif name == 'DEC':
+            registers[instruction.reg] = (registers[instruction.reg] - 1) & 0xffffffffffffffff
+        elif name == 'INC':
+            registers[instruction.reg] = (registers[instruction.reg] + 1) & 0xffffffffffffffff
+        elif name == 'J':
+            pc = instruction.arg
+        elif name == 'JNZ':
+            if registers[instruction.reg] != 0:
+                pc = instruction.arg
+        elif name == '???':
+            timing.errors.append("Unknown opcode at {}: {}".format(hex(instruction.address), hex(instruction.cmd)))
+            break
+        time += cycle  # all other instructions take one clock cycle
+    timing.duration = time
+    return timing
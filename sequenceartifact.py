@@ -0,0 +1,126 @@
+"""
+Sequence Artifact
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Versioned binary container for assembled sequences.
+            Layout (little endian):
+                header      magic 'GOSQ', format version, flags, offset of the words,
+                            number of words, sha256 of the normalized source, size of the table
+                table       JSON: variable table (name -> address) and parameter slots
+                            (name -> kind, targets; first entry of a target is the instruction index)
+                padding     up to the next 8 byte boundary
+                words       raw instruction words ('<u4', low half of each instruction first)
+            Loading maps the file and hands out the words as a memoryview without copying
+            or parsing them, the table is only decoded when accessed.
+"""
+
+# system includes
+import os
+import json
+import mmap
+import struct
+import numpy as np
+
+# project includes
+from assembler import WORD_DTYPE
+
+MAGIC = b'GOSQ'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII32sI')  # magic, version, flags, words offset, number of words, source hash, table size
+ALIGNMENT = 8
+EXTENSION = '.gsq'
+
+class SequenceArtifact:
+    def __init__(self, path: str):
+        """
+        Map a sequence artifact into memory
+        @param path:    path of the artifact file
+        @return:        None
+        @raise:         ValueError if the file is no (complete) artifact of this version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < HEADER.size:
+                raise ValueError("{} is too short for a sequence artifact.".format(path))
+            [magic, version, self.flags, offset, numWords, digest, tablesize] = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError("{} is no sequence artifact.".format(path))
+            if version != VERSION:
+                raise ValueError("{} has artifact version {}, expected {}.".format(path, version, VERSION))
+            if offset + 4 * numWords > len(self._map) or HEADER.size + tablesize > offset:
+                raise ValueError("{} is truncated.".format(path))
+        except ValueError:
+            self._map.close()
+            raise
+        self.version = version
+        self.sourcehash = digest.hex()
+        self._tablesize = tablesize
+        self._table = None
+        # the memoryview keeps the mapping alive as long as anybody holds the words
+        self.words = memoryview(self._map)[offset:offset + 4 * numWords]
+
+    @property
+    def table(self) -> dict:
+        if self._table is None:
+            raw = self._map[HEADER.size:HEADER.size + self._tablesize]
+            self._table = json.loads(raw.decode()) if raw else {}
+        return self._table
+
+    @property
+    def variables(self) -> dict:
+        return self.table.get('variables', {})
+
+    @property
+    def slots(self) -> dict:
+        return self.table.get('slots', {})
+
+    @property
+    def array(self) -> np.ndarray:
+        # read-only view of the instruction words
+        return np.frombuffer(self.words, WORD_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.words) // 8  # number of instructions
+
+def loadArtifact(path: str):
+    """
+    Load a sequence artifact, tolerate missing or broken files
+    @param path:    path of the artifact file
+    @return:        SequenceArtifact or None
+    """
+    try:
+        return SequenceArtifact(path)
+    except (OSError, ValueError):
+        return None
+
+def writeArtifact(path: str, words, sourcehash: str, variables: dict = None, slots: dict = None) -> None:
+    """
+    Write assembled instruction words into a sequence artifact
+    @param path:        path of the artifact file
+    @param words:       instruction words (array of WORD_DTYPE or bytes-like)
+    @param sourcehash:  sha256 (hex) of the normalized sequence source
+    @param variables:   variable table of the assembler (name -> address)
+    @param slots:       parameter slots of the sequence document (name -> ParameterSlot)
+    @return:            None
+    """
+    words = np.frombuffer(words, WORD_DTYPE) if not isinstance(words, np.ndarray) else words.astype(WORD_DTYPE, copy=False)
+    table = {
+        'variables': variables or {},
+        'slots': {name: {'kind': slot.kind, 'targets': slot.targets} for name, slot in (slots or {}).items()}
+    }
+    raw = json.dumps(table, sort_keys=True).encode()
+    offset = -(-(HEADER.size + len(raw)) // ALIGNMENT) * ALIGNMENT
+    header = HEADER.pack(MAGIC, VERSION, 0, offset, len(words), bytes.fromhex(sourcehash), len(raw))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header)
+        f.write(raw)
+        f.write(bytes(offset - HEADER.size - len(raw)))
+        f.write(memoryview(words).cast('B'))
+    os.replace(path + '.tmp', path)  # never leave a half written program behind
@@ -0,0 +1,179 @@
+"""
+Sequence Document
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   In-memory model of a sequence file with named parameter slots
+            (hexadecimal variables and annotated delays, see sequencetemplate).
+            Documents are parsed once per file and cloned for each operation. Setting a
+            parameter only marks the document as dirty, the file is written on save().
+            Template and bytestream may be built in a warm-up thread while the GUI sets
+            parameters, each document has a lock for its lines, values and bytestream.
+"""
+
+# system includes
+import re
+import threading
+from warnings import warn
+
+# project includes
+from assembler import Assembler
+from sequencetemplate import SequenceTemplate, parseSlots
+
+class SequenceDocument:
+    def __init__(self, lines: list, path: str = None):
+        """
+        Initialization of sequence document
+        @param lines:   source lines of the sequence
+        @param path:    path of the sequence file
+        @return:        None
+        """
+        self.path = path
+        self.lines: list = list(lines)
+        self.slots: dict = {}
+        self.values: dict = {}
+        self.dirty: bool = False
+        self._template = None
+        self._bytestream = None
+        self._lock = threading.RLock()  # lines, values, template and bytestream change together
+        self.parse()
+
+    @classmethod
+    def fromFile(cls, path: str):
+        with open(path) as f:
+            return cls(f.readlines(), path)
+
+    def parse(self) -> None:
+        [self.slots, self.values] = parseSlots(self.lines, self.path)
+
+    @property
+    def template(self) -> SequenceTemplate:
+        # compiled once, shared with all clones
+        with self._lock:
+            if self._template is None:
+                self._template = SequenceTemplate(self.lines, self.slots, self.values, self.path)
+            return self._template
+
+    def clone(self):
+        """
+        Get a copy of the document that can be modified independently
+        @return:    SequenceDocument
+        """
+        doc = SequenceDocument.__new__(SequenceDocument)
+        doc._lock = threading.RLock()
+        with self._lock:
+            doc.path = self.path
+            doc.lines = list(self.lines)
+            doc.slots = self.slots  # slots are never modified after parsing
+            doc.values = dict(self.values)
+            doc.dirty = self.dirty
+            doc._template = self._template
+            doc._bytestream = self._bytestream
+        return doc
+
+    def has(self, name: str) -> bool:
+        return name in self.slots
+
+    def get(self, name: str):
+        return self.values[name]
+
+    def set(self, name: str, value) -> None:
+        """
+        Set the value of a parameter slot
+        @param name:    name of the parameter (TE, TI, LOOP_CTR...)
+        @param value:   value of the parameter (ms for delays)
+        @return:        None
+        """
+        if name not in self.slots:
+            warn("Sequence {} has no parameter {}.".format(self.path, name))
+            return
+        with self._lock:
+            if self.values[name] == value:
+                return
+            slot = self.slots[name]
+            for target in slot.targets:
+                idx = target[0]
+                tokens = Assembler.strip_lines(self.lines[idx]).split(' ')
+                code, separator, comment = self.lines[idx].partition('//')
+                newcode = slot.code(tokens, value, *target[1:])
+                if separator:
+                    whitespace = code[len(code.rstrip()):] or '\t'
+                    self.lines[idx] = newcode + whitespace + separator + comment
+                else:
+                    self.lines[idx] = newcode + '\n'
+            self.values[name] = value
+            self.dirty = True
+            self._bytestream = None
+
+    @property
+    def bytestream(self) -> memoryview:
+        # patched on first access after a change
+        with self._lock:
+            if self._bytestream is None:
+                self._bytestream = self.template.patch(self.values)
+            return self._bytestream
+
+    def unroll(self, name: str, values: list, recoveryTime: float = 0):
+        """
+        Generate one program running the sequence for every value of a parameter back to back
+        @param name:            name of the parameter (TE, TI...)
+        @param values:          values of the parameter, one block of the loop body each
+        @param recoveryTime:    delay between two blocks in ms
+        @return:                SequenceDocument (not saved, no file)
+        """
+        with self._lock:
+            # loop body: from JNZ target to the DEC in front of the JNZ, repeated LOOP_CTR times
+            instructions = [Assembler.strip_lines(line).split(' ') for line in self.lines]
+            jnzIdx = max(idx for idx, tokens in enumerate(instructions) if tokens[0] == 'JNZ')
+            bodyStart = int(instructions[jnzIdx][2], 16)
+            bodyEnd = jnzIdx - 1
+            if instructions[bodyEnd][0] != 'DEC':
+                raise ValueError("Sequence {} has no DEC in front of its JNZ, can't unroll it.".format(self.path))
+
+            tag = re.compile(r'\s*@' + name + r'\([^)]*\)')
+            lines = self.lines[0:bodyStart]
+            for value in values:
+                doc = self.clone()
+                doc.set(name, value)
+                lines += [tag.sub('', line) for line in doc.lines[bodyStart:bodyEnd]]
+                if recoveryTime > 0:
+                    lines.append('PR 3, {}\t// recovery\n'.format(int(recoveryTime * 1000)))
+            lines += self.lines[bodyEnd:]
+            return SequenceDocument(lines)
+
+    @property
+    def source(self) -> str:
+        with self._lock:
+            return ''.join(self.lines)
+
+    def save(self, path: str = None) -> None:
+        """
+        Write the document to disk
+        @param path:    file to write to (default: file the document was loaded from)
+        @return:        None
+        """
+        if path is None:
+            path = self.path
+        with open(path, 'w') as out_file:
+            out_file.write(self.source)
+        if path == self.path:
+            self.dirty = False
+        _documents.pop(path, None)  # next load parses the new file
+
+# parsed documents, one per file
+_documents: dict = {}
+_lock = threading.Lock()  # documents may be loaded from a warm-up thread
+
+def loadDocument(path: str, reload: bool = False) -> SequenceDocument:
+    """
+    Get a sequence document, the file is only read and parsed on first load
+    @param path:    path of the sequence file
+    @param reload:  read the file again
+    @return:        independent copy of the document
+    """
+    with _lock:
+        if reload or path not in _documents:
+            _documents[path] = SequenceDocument.fromFile(path)
+        return _documents[path].clone()
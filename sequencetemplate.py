@@ -0,0 +1,145 @@
+"""
+Sequence Template
+
+@author:    Sula Mueller
+@version:   1.1.0
+@change:    17/10/2026
+
+@summary:   Class for sequences that are assembled once and then patched.
+            Parameter slots are the hexadecimal variables of a sequence (e.g. LOOP_CTR) and delays
+            annotated in the comment of a PR line, e.g.
+                PR 3, 99888     // wait&r @TE(0.5, -112)
+            with delay [us] = factor * value [ms] * 1000 + offset [us].
+            The template records which instruction words hold the slots, setting a parameter
+            only rewrites those words in a copy of the binary.
+"""
+
+# system includes
+import re
+import numpy as np
+from warnings import warn
+
+# project includes
+from assembler import Assembler, WORD_DTYPE, CONST_MASK
+from assemblycache import AsmCache
+
+# annotation of a delay slot: @name(factor, offset)
+delayannotation = re.compile(r'@(\w+)\(\s*([-+.\d]+)\s*,\s*([-+\d]+)\s*\)')
+
+class ParameterSlot:
+    delayslot = 'delay'
+    variableslot = 'variable'
+
+    def __init__(self, name: str, kind: str, description: str = ''):
+        """
+        Initialization of parameter slot
+        @param name:        name of the parameter (TE, TI, LOOP_CTR...)
+        @param kind:        ParameterSlot.delayslot or ParameterSlot.variableslot
+        @param description: comment of the (first) line holding the parameter
+        @return:            None
+        """
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.unit = 'ms' if self.isDelay else ''
+        self.targets: list = []  # [line index, factor, offset] for delays, [line index] for variables
+
+    @property
+    def isDelay(self) -> bool:
+        return self.kind == self.delayslot
+
+    @staticmethod
+    def delay(value: float, factor: float, offset: int) -> int:
+        # delay in us of a line for a parameter value in ms
+        return int(value * factor * 1000 + offset)
+
+    def code(self, tokens: list, value, factor: float = None, offset: int = None) -> str:
+        # instruction of a target line for a parameter value
+        if self.isDelay:
+            return 'PR {}, {}'.format(tokens[1], self.delay(value, factor, offset))
+        return '{} = {}'.format(self.name, hex(int(value)))
+
+def parseSlots(lines: list, path: str = None) -> list:
+    """
+    Find the parameter slots of a sequence
+    @param lines:   source lines of the sequence
+    @param path:    path of the sequence file (for warnings)
+    @return:        [slots (name -> ParameterSlot), values the lines were written for (name -> value)]
+    """
+    slots: dict = {}
+    values: dict = {}
+    for idx, line in enumerate(lines):
+        code = Assembler.strip_lines(line)
+        comment = line.partition('//')[2].strip()
+        if '=' in code:  # variable, only hexadecimal values can be set
+            [name, value] = code.replace(' ', '').split('=', 1)
+            if any(str.isdigit(c) for c in value):
+                slot = ParameterSlot(name, ParameterSlot.variableslot, comment)
+                slot.targets.append([idx])
+                slots[name] = slot
+                values[name] = int(value, 16)
+            continue
+        for match in delayannotation.finditer(comment):
+            tokens = code.split(' ')
+            if tokens[0] != 'PR':
+                warn("Line {} of {} is not a PR instruction, ignoring @{}.".format(idx + 1, path, match.group(1)))
+                continue
+            [name, factor, offset] = [match.group(1), float(match.group(2)), int(match.group(3))]
+            if name not in slots:
+                slots[name] = ParameterSlot(name, ParameterSlot.delayslot, comment)
+                value = (int(tokens[-1]) - offset) / factor / 1000
+                values[name] = int(value) if value == int(value) else value
+            slots[name].targets.append([idx, factor, offset])
+    return [slots, values]
+
+class SequenceTemplate:
+    def __init__(self, lines: list, slots: dict, values: dict, path: str = None):
+        """
+        Initialization of sequence template
+        @param lines:   source lines of the sequence
+        @param slots:   parameter slots of the sequence (name -> ParameterSlot)
+        @param values:  parameter values the source lines were written for
+        @param path:    path of the sequence file (for listing and cache)
+        @return:        None
+        """
+        self.words = np.frombuffer(AsmCache.assembleLines(lines, path, slots), WORD_DTYPE)
+        self.slots = slots
+        self.baseValues = dict(values)
+
+    @property
+    def bytestream(self) -> memoryview:
+        # unpatched program, may be a view into a mapped sequence artifact
+        return memoryview(self.words).cast('B')
+
+    def patch(self, values: dict) -> memoryview:
+        """
+        Get bytestream with parameter slots set
+        @param values:  parameter values (name -> value)
+        @return:        patched bytestream
+        """
+        changed = [name for name in values if values[name] != self.baseValues.get(name)]
+        if not changed:
+            return self.bytestream
+        words = self.words.copy()
+        for name in changed:
+            slot = self.slots[name]
+            for target in slot.targets:
+                if slot.isDelay:
+                    [idx, factor, offset] = target
+                    self.setDelay(words, idx, slot.delay(values[name], factor, offset))
+                else:
+                    self.setWord(words, target[0], values[name])
+        return memoryview(words).cast('B')
+
+    @staticmethod
+    def setDelay(words: np.ndarray, idx: int, delay: int) -> None:
+        # PR keeps its delay in the lower 40 bits: the whole low word and the lowest byte of the high word
+        cycles = Assembler.delay_cycles(delay)
+        words[2 * idx] = cycles & 0xffffffff
+        words[2 * idx + 1] = (int(words[2 * idx + 1]) & ~(CONST_MASK >> 32)) | (cycles >> 32)
+
+    @staticmethod
+    def setWord(words: np.ndarray, idx: int, value: int) -> None:
+        # variables take the whole 64 bit instruction word
+        words[2 * idx] = value & 0xffffffff
+        words[2 * idx + 1] = (value >> 32) & 0xffffffff
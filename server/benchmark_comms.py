@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Microbenchmark of the packet utilities in server_comms against their former implementations,
+# on gradient and TX memories of several MB.
+# Usage: python server/benchmark_comms.py [--sizes 1 4 16] [--repeats 3]
+
+import time
+import argparse
+import socket
+import threading
+import msgpack
+import numpy as np
+
+import server_comms as sc
+
+def legacy_ba_flip_endian(ba):
+    # former implementation: python loop, 4 bytes at a time
+    N = len(ba)
+    ba2 = bytearray(N)
+    for k in range(N//4):
+        ba2[4*k] = ba[4*k+3]
+        ba2[4*k+1] = ba[4*k+2]
+        ba2[4*k+2] = ba[4*k+1]
+        ba2[4*k+3] = ba[4*k]
+    return ba2
+
+def legacy_send_packet(packet, socket):
+    # former implementation: whole packet packed, replies received in 1024 byte pieces
+    # (it called socket.write, which sockets don't have)
+    socket.sendall(msgpack.packb(packet))
+
+    unpacker = msgpack.Unpacker()
+    while True:
+        buf = socket.recv(1024)
+        if not buf:
+            break
+        unpacker.feed(buf)
+        for o in unpacker:
+            return o
+
+def echo_server(sock):
+    # replies to every packet with its data, like a console returning the memories it was given
+    unpacker = msgpack.Unpacker(max_buffer_size=0)
+    while True:
+        buf = sock.recv(1 << 20)
+        if not buf:
+            return
+        unpacker.feed(buf)
+        for packet in unpacker:
+            sock.sendall(msgpack.packb([sc.reply_pkt, packet[1], 0, sc.version_full, packet[4], {}]))
+
+def best_time(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def memories(size_MB, rng):
+    # gradient memory (int32 words) and TX memory (complex int16 pairs) of size_MB each
+    n = size_MB * (1 << 20) // 4
+    grad_mem = rng.integers(-(1 << 31), 1 << 31, n, dtype=np.int64).astype('<i4').tobytes()
+    tx_mem = rng.integers(-(1 << 15), 1 << 15, 2 * n, dtype=np.int64).astype('<i2').tobytes()
+    return grad_mem, tx_mem
+
+def report(name, size, legacy, current):
+    print("{:<16} {:>6.1f} MB   legacy {:>9.1f} MB/s   current {:>9.1f} MB/s   x{:.1f}".format(
+        name, size / 1e6, size / legacy / 1e6, size / current / 1e6, legacy / current))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the packet utilities of server_comms.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16], help="memory sizes in MB")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    for size_MB in args.sizes:
+        grad_mem, tx_mem = memories(size_MB, rng)
+
+        for name, mem in (('flip grad_mem', grad_mem), ('flip tx_mem', tx_mem + b'\x01\x02')):
+            legacy, expected = best_time(lambda: legacy_ba_flip_endian(mem), 1)
+            current, result = best_time(lambda: sc.ba_flip_endian(mem), args.repeats)
+            assert result == expected, "ba_flip_endian differs from the former implementation"
+            report(name, len(mem), legacy, current)
+
+        client, server = socket.socketpair()
+        thread = threading.Thread(target=echo_server, args=(server,), daemon=True)
+        thread.start()
+        packet = sc.construct_packet({'grad_mem': grad_mem, 'tx_mem': tx_mem})
+        size = len(grad_mem) + len(tx_mem)
+        legacy, expected = best_time(lambda: legacy_send_packet(packet, client), args.repeats)
+        current, result = best_time(lambda: sc.send_packet(packet, client), args.repeats)
+        assert result == expected, "send_packet differs from the former implementation"
+        report('send_packet', 2 * size, legacy, current)
+        client.close()
+        thread.join()
+        server.close()
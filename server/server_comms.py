@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+import hashlib
+import struct
 import msgpack
+import numpy as np
 
 version_major = 0
 version_minor = 0
@@ -12,6 +15,23 @@ emergency_stop_pkt = 1
 close_server_pkt = 2
 reply_pkt = 128
 
+# sequence upload: the server keeps the last program, the client sends its hash and either
+# nothing (same program), a patch of changed instruction words against seq_base, or the full seq_data
+seq_data_key = 'seq_data'
+seq_hash_key = 'seq_hash'
+seq_base_key = 'seq_base'
+seq_patch_key = 'seq_patch'
+
+# acquired data: the client asks for a format, the reply names the format used and the scale to volts
+acq_format_key = 'acq_format'
+acq_scale_key = 'acq_scale'
+acq_formats = {
+    'complex64': (np.dtype('<f4'), None),
+    'int16': (np.dtype('<i2'), 32767),
+    'float16': (np.dtype('<f2'), 65504),
+    'int8': (np.dtype('i1'), 127)
+}
+
 def construct_packet(data, packet_idx=0, command=request_pkt, version=(version_major, version_minor, version_debug)):
     vma, vmi, vd = version
     assert vma < 256 and vmi < 256 and vd < 256, "Version is too high for a byte!"
@@ -56,29 +76,111 @@ def process(payload, print_all=False):
         print("Reply data: ")
         print(reply_data)
 
-def send_packet(packet, socket):
-    # socket.sendall(msgpack.packb(packet))
-    socket.write(msgpack.packb(packet))
+recv_buffer_size = 1 << 20 # bytes of the reusable receive buffer
+large_bin_size = 1 << 16 # binary fields from this size on are sent from their memory, not copied into the packet
+
+def pack_packet(obj, packer=None):
+    # msgpack chunks of an object: small parts packed, large binary fields as memoryviews of their data
+    packer = packer or msgpack.Packer()
+    if isinstance(obj, (bytes, bytearray, memoryview)) and len(obj) >= large_bin_size:
+        view = memoryview(obj).cast('B')
+        return [b'\xc6' + struct.pack('>I', len(view)), view]
+    if isinstance(obj, dict) and any(isinstance(v, (dict, list, tuple, bytes, bytearray, memoryview)) for v in obj.values()):
+        chunks = [packer.pack_map_header(len(obj))]
+        for k, v in obj.items():
+            chunks += [packer.pack(k)] + pack_packet(v, packer)
+        return chunks
+    if isinstance(obj, (list, tuple)) and any(isinstance(v, (dict, list, tuple, bytes, bytearray, memoryview)) for v in obj):
+        chunks = [packer.pack_array_header(len(obj))]
+        for v in obj:
+            chunks += pack_packet(v, packer)
+        return chunks
+    return [packer.pack(obj)]
 
-    unpacker = msgpack.Unpacker()
-    packet_done = False
-    while not packet_done:
-        buf = socket.recv(1024)
-        if not buf:
-            break
-        unpacker.feed(buf)
-        for o in unpacker: # ugly way of doing it
-            return o # quit function after 1st reply (could make this a thread in the future)
+def send_packet(packet, socket, buffer=None):
+    # send a packet and wait for the reply, buffer: reusable bytearray for receiving
+    pending = bytearray()
+    for chunk in pack_packet(packet):
+        if isinstance(chunk, memoryview): # large field: flush the small parts, send the field without copy
+            socket.sendall(pending)
+            pending = bytearray()
+            socket.sendall(chunk)
+        else:
+            pending += chunk
+    socket.sendall(pending)
+
+    global recv_buffer
+    if buffer is None:
+        if recv_buffer is None:
+            recv_buffer = bytearray(recv_buffer_size)
+        buffer = recv_buffer
+    view = memoryview(buffer)
+    unpacker = msgpack.Unpacker(max_buffer_size=0)
+    while True:
+        n = socket.recv_into(view)
+        if not n:
+            return None
+        unpacker.feed(view[0:n])
+        for o in unpacker:
+            return o # quit function after 1st reply
+
+recv_buffer = None
 
 def ba_flip_endian(ba):
     # Flip the endianness of the byte array, to suit the server hardware's strange convention
+    # (32-bit words, trailing bytes that don't fill a word are zero)
     N = len(ba)
     ba2 = bytearray(N)
+    np.frombuffer(ba2, '<u4', count=N//4)[:] = np.frombuffer(ba, '>u4', count=N//4)
+    return ba2
 
-    for k in range(N//4):
-        ba2[4*k] = ba[4*k+3]
-        ba2[4*k+1] = ba[4*k+2]
-        ba2[4*k+2] = ba[4*k+1]
-        ba2[4*k+3] = ba[4*k]
+def sequence_hash(program):
+    return hashlib.blake2b(program, digest_size=16).hexdigest()
 
-    return ba2
+def apply_patch(program, patch):
+    # patch: pairs of little endian uint32 (index of 32-bit word, new word)
+    words = bytearray(program)
+    for idx, word in struct.iter_unpack('<II', patch):
+        struct.pack_into('<I', words, 4*idx, word)
+    return bytes(words)
+
+class SequenceStore:
+    # last program uploaded by the client, keyed by its hash
+    def __init__(self):
+        self.program = None
+        self.hash = None
+
+    def handle(self, data):
+        # update the program from a request, returns the program to run (None if the request doesn't fit the stored one)
+        if seq_data_key in data:
+            program = bytes(data[seq_data_key])
+        elif seq_patch_key in data:
+            if self.program is None or data.get(seq_base_key) != self.hash:
+                return None
+            program = apply_patch(self.program, data[seq_patch_key])
+        elif seq_hash_key in data:
+            return self.program if data[seq_hash_key] == self.hash else None
+        else:
+            return self.program
+
+        key = sequence_hash(program)
+        if seq_hash_key in data and data[seq_hash_key] != key:
+            return None # corrupted on the way, keep the last program
+        self.program = program
+        self.hash = key
+        return program
+
+def quantize(samples, fmt='complex64'):
+    # complex samples to interleaved I/Q values of the format, returns (raw bytes, format, scale to volts)
+    if fmt not in acq_formats:
+        fmt = 'complex64'
+    dtype, full_scale = acq_formats[fmt]
+    iq = np.ascontiguousarray(samples, np.complex64).view(np.float32)
+    if full_scale is None:
+        return iq.tobytes(), fmt, 1.0
+    peak = float(np.max(np.abs(iq))) if len(iq) else 0.0
+    scale = peak / full_scale if peak > 0 else 1.0
+    if dtype.kind == 'f' and peak <= full_scale:
+        scale = 1.0 # float16 keeps volts unless they overflow
+    values = np.rint(iq / scale) if dtype.kind == 'i' else iq / scale
+    return values.astype(dtype).tobytes(), fmt, scale
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+#
+# Console simulator: speaks the msgpack protocol of the console, no hardware needed.
+# 'acq' is answered with a synthetic FID/echo signal of a sample with T1, T2 and T2*, computed from
+# the timing of the uploaded program (RF pulses and receive windows, see sequenceanalyzer) and the
+# offset between the Larmor frequency and 'lo_freq', quantized if 'acq_format' asks for it.
+# Network latency, bandwidth and noise can be set.
+# Usage: python server/simulator.py [--port 1001] [--latency 5 --bandwidth 10 --noise 0.01], then
+# connect GOmri to 127.0.0.1
+
+import os
+import sys
+import time
+import argparse
+import socketserver
+import msgpack
+import numpy as np
+
+import server_comms as sc
+
+# timing of programs with the analyzer of the GUI
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import configvars
+from sequenceanalyzer import analyze
+
+lo_freq_key = 'lo_freq'
+acq_key = 'acq'
+test_throughput_key = 'test_throughput'
+
+class Sample:
+    def __init__(self, larmor=5.8882, t1=100.0, t2=50.0, t2star=5.0, amplitude=0.5):
+        # larmor in MHz, relaxation times in ms, amplitude in V
+        self.larmor = larmor
+        self.t1 = t1
+        self.t2 = t2
+        self.t2star = min(t2star, t2)
+        self.amplitude = amplitude
+
+def lo_frequency(word):
+    # inverse of CommunicationManager.constructScanParameterPacket, in MHz
+    return (word & 0xfffffff0) / (1 << 30) * configvars.fpga_clk_frequency_MHz
+
+def synthesize(timing, num_samples, offset, sample, noise=0.0, rng=None):
+    # signal received in the readout windows of a program
+    # timing: SequenceTiming, offset: Larmor frequency - LO frequency in Hz
+    # the longest RF pulses of a program refocus (180 deg), all others excite (90 deg)
+    dt = configvars.timePerSample
+    durations = [round(pulse[1], 6) for pulse in timing.rfPulses]
+    refocus = max(durations) if len(set(durations)) > 1 else None
+
+    events = [(start + duration / 2, 0, round(duration, 6) == refocus) for start, duration in timing.rfPulses]
+    events += [(start, 1, duration) for start, duration in timing.readoutWindows]
+    events.sort(key=lambda event: event[0:2])
+
+    mz = 1.0 # longitudinal magnetization (relaxed at program start)
+    t_mz = 0.0
+    amp = 0.0 # transverse magnetization after the last excitation
+    t_ex = 0.0
+    t_center = 0.0 # FID start or echo center
+    decay = 1 / sample.t2star - 1 / sample.t2 # dephasing, refocused by 180 deg pulses
+
+    signal = np.zeros(num_samples, np.complex64)
+    filled = 0
+    for t, kind, arg in events:
+        if filled >= num_samples:
+            break
+        mz = 1 - (1 - mz) * np.exp(-(t - t_mz) / sample.t1)
+        t_mz = t
+        if kind == 0 and arg: # refocusing pulse
+            mz = -mz
+            t_center = 2 * t - t_center
+        elif kind == 0: # excitation pulse
+            amp = mz
+            mz = 0.0
+            t_ex = t
+            t_center = t
+        elif amp != 0:
+            n = min(int(round(arg / dt)), num_samples - filled)
+            ts = t + np.arange(n) * dt
+            signal[filled:filled + n] = sample.amplitude * amp * np.exp(-(ts - t_ex) / sample.t2 - np.abs(ts - t_center) * decay) \
+                * np.exp(2j * np.pi * offset * 1e-3 * (ts - t_center))
+            filled += n
+        else:
+            filled += min(int(round(arg / dt)), num_samples - filled)
+
+    if noise > 0:
+        rng = rng or np.random.default_rng()
+        signal += (noise * (rng.standard_normal(num_samples) + 1j * rng.standard_normal(num_samples))).astype(np.complex64)
+    return signal
+
+class ConsoleHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        # state is kept per connection, like on the console
+        self.store = sc.SequenceStore()
+        self.lo_freq = None
+        self.rng = np.random.default_rng(self.server.settings.seed)
+
+    def handle(self):
+        unpacker = msgpack.Unpacker()
+        while True:
+            buf = self.request.recv(1 << 16)
+            if not buf:
+                break
+            unpacker.feed(buf)
+            for packet in unpacker:
+                reply = self.process(packet)
+                if reply is None:
+                    self.server.shutdown_request(self.request)
+                    return
+                self.send(msgpack.packb(reply))
+
+    def send(self, raw):
+        settings = self.server.settings
+        if settings.latency > 0:
+            time.sleep(settings.latency / 1e3)
+        if settings.bandwidth <= 0:
+            self.request.sendall(raw)
+            return
+        chunk = 1 << 16
+        view = memoryview(raw)
+        for k in range(0, len(raw), chunk):
+            start = time.perf_counter()
+            self.request.sendall(view[k:k + chunk])
+            wait = len(view[k:k + chunk]) / (settings.bandwidth * 1e6) - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+
+    def process(self, packet):
+        command, packet_idx, _, _, data = packet[0:5]
+        reply_data = {}
+        status = {}
+
+        if command == sc.close_server_pkt:
+            return None
+        if command == sc.request_pkt:
+            self.request_data(data, reply_data, status)
+        elif command != sc.emergency_stop_pkt:
+            status['errors'] = ["Unknown command {}".format(command)]
+        return [sc.reply_pkt, packet_idx, 0, sc.version_full, reply_data, status]
+
+    def request_data(self, data, reply_data, status):
+        settings = self.server.settings
+        errors = []
+
+        if lo_freq_key in data:
+            self.lo_freq = lo_frequency(data[lo_freq_key])
+            reply_data[lo_freq_key] = 0
+
+        program = self.store.handle(data)
+        if any(key in data for key in (sc.seq_data_key, sc.seq_hash_key, sc.seq_patch_key)):
+            reply_data[sc.seq_hash_key] = self.store.hash
+            if program is None:
+                errors.append("Sequence unknown, send the full program")
+
+        if acq_key in data:
+            timing = analyze(program) if program is not None else None
+            if timing is None or not timing.valid:
+                errors.append("No valid sequence to acquire with")
+            else:
+                if settings.realtime:
+                    time.sleep(timing.duration / 1e3)
+                lo_freq = self.lo_freq if self.lo_freq is not None else settings.sample.larmor
+                offset = (settings.sample.larmor - lo_freq) * 1e6
+                signal = synthesize(timing, int(data[acq_key]), offset, settings.sample, settings.noise, self.rng)
+                raw, fmt, scale = sc.quantize(signal, data.get(sc.acq_format_key, 'complex64'))
+                reply_data[acq_key] = raw
+                if sc.acq_format_key in data:
+                    reply_data[sc.acq_format_key] = fmt
+                    reply_data[sc.acq_scale_key] = scale
+
+        if test_throughput_key in data:
+            n = int(data[test_throughput_key])
+            reply_data[test_throughput_key] = {'array1': list(range(n)), 'array2': [k * 0.5 for k in range(n)]}
+
+        if errors:
+            status['errors'] = errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the console on this machine.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1001)
+    parser.add_argument('--latency', type=float, default=0, help="delay of each reply in ms")
+    parser.add_argument('--bandwidth', type=float, default=0, help="link bandwidth in MB/s (0: unlimited)")
+    parser.add_argument('--noise', type=float, default=0.005, help="noise standard deviation in V")
+    parser.add_argument('--realtime', action='store_true', help="take as long as the program runs")
+    parser.add_argument('--larmor', type=float, default=5.8882, help="Larmor frequency in MHz")
+    parser.add_argument('--t1', type=float, default=100.0, help="T1 in ms")
+    parser.add_argument('--t2', type=float, default=50.0, help="T2 in ms")
+    parser.add_argument('--t2star', type=float, default=5.0, help="T2* in ms")
+    parser.add_argument('--amplitude', type=float, default=0.5, help="signal amplitude in V")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the noise")
+    args = parser.parse_args()
+    args.sample = Sample(args.larmor, args.t1, args.t2, args.t2star, args.amplitude)
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer((args.host, args.port), ConsoleHandler) as server:
+        server.settings = args
+        print("Console simulator listening on {}:{}".format(args.host, args.port))
+        server.serve_forever()
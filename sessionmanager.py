@@ -0,0 +1,149 @@
+"""
+Session Manager
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Connections to several consoles at once.
+            Every console has its own connection (session, a CommunicationManager), the default
+            session is ComMngr. Requests can be fanned out to several consoles, they run
+            concurrently and the replies are collected per console (FanOut).
+"""
+
+# system includes
+from PyQt5.QtCore import pyqtSignal, QObject, QEventLoop
+
+# project includes
+from config import configvars
+from communicationmanager import ComMngr, CommunicationManager, Commands as cmd, PROTOCOL_VERSION
+
+DEFAULT_SESSION = 'default'
+
+class FanOut(QObject):
+    finished = pyqtSignal(dict, name='onFinished')  # console name -> reply
+
+    def __init__(self, requests: dict, errors: dict = None, parent=None):
+        """
+        Initialization of requests sent to several consoles
+        @param requests:    console name -> PendingReply
+        @param errors:      console name -> reason, for consoles the request wasn't sent to
+        @param parent:      SessionManager
+        @return:            None
+        """
+        super(FanOut, self).__init__(parent)
+        self.requests = requests
+        self.replies: dict = {}
+        self.errors: dict = dict(errors or {})
+        for name, request in requests.items():
+            request.finished.connect(lambda reply, name=name: self.collect(name, reply, None))
+            request.failed.connect(lambda error, name=name: self.collect(name, None, error))
+
+    @property
+    def done(self) -> bool:
+        return len(self.replies) + len(self.errors) >= len(set(self.requests) | set(self.errors))
+
+    def collect(self, name: str, reply, error: str) -> None:
+        if error is not None:
+            self.errors[name] = error
+        else:
+            self.replies[name] = reply
+        if self.done:
+            self.finished.emit(self.replies)
+
+    def cancel(self) -> None:
+        for request in self.requests.values():
+            request.cancel()
+
+    def wait(self) -> dict:
+        """
+        Wait for all consoles, events (GUI) are processed meanwhile
+        @return:    console name -> reply (consoles that failed are in self.errors)
+        """
+        if not self.done:
+            loop = QEventLoop()
+            self.finished.connect(loop.quit)
+            loop.exec_()
+        return self.replies
+
+    def acquired(self) -> dict:
+        # console name -> acquired data (complex64)
+        return {name: CommunicationManager.acquiredData(reply[4])
+                for name, reply in self.replies.items() if cmd.runAcquisition in reply[4]}
+
+class SessionManager(QObject):
+    def __init__(self):
+        super(SessionManager, self).__init__()
+        self.sessions: dict = {DEFAULT_SESSION: ComMngr}  # console name -> CommunicationManager
+
+    def addConsole(self, name: str, IP: str, port: int = 1001, connect: bool = True) -> CommunicationManager:
+        """
+        Add a console with its own connection
+        @param name:    name of the console (bench)
+        @param IP:      IP address of the console
+        @param port:    port of the console
+        @param connect: connect right away
+        @return:        session of the console
+        """
+        if name in self.sessions:
+            session = self.sessions[name]
+        else:
+            session = CommunicationManager()
+            self.sessions[name] = session
+        if connect:
+            session.connectClient(IP, port)
+        return session
+
+    def removeConsole(self, name: str) -> None:
+        if name == DEFAULT_SESSION:
+            return
+        session = self.sessions.pop(name, None)
+        if session is not None:
+            session.disconnectClient()
+
+    def session(self, name: str = DEFAULT_SESSION) -> CommunicationManager:
+        return self.sessions[name]
+
+    def disconnectAll(self) -> None:
+        for session in self.sessions.values():
+            session.disconnectClient()
+
+    def submit(self, packet, names: list = None, timeout: int = configvars.communicationTimeout, expectedSize: int = 0) -> FanOut:
+        """
+        Send the same packet to several consoles, don't wait for the replies
+        @param packet:          packet fields [command, packet_idx, 0, version, data]
+        @param names:           consoles (default: all)
+        @param timeout:         max. time in ms to wait for each reply
+        @param expectedSize:    expected size of each reply in bytes
+        @return:                FanOut
+        """
+        names = list(self.sessions) if names is None else names
+        requests = {}
+        errors = {}
+        for name in names:
+            if name not in self.sessions:
+                errors[name] = "Unknown console."
+                continue
+            # every session numbers its own packets
+            requests[name] = self.sessions[name].sendRequest(list(packet), timeout, expectedSize)
+        return FanOut(requests, errors, self)
+
+    def acquire(self, operation, numAcqSamples: int = None, names: list = None) -> FanOut:
+        """
+        Run an operation on several consoles concurrently
+        @param operation:       operation (sequence and scan parameters)
+        @param numAcqSamples:   number of samples to acquire (default: from the operation)
+        @param names:           consoles (default: all)
+        @return:                FanOut (acquired() gives the data per console)
+        """
+        if numAcqSamples is None:
+            numAcqSamples = int(operation.numSamples if hasattr(operation, 'numSamples') else operation.numSamplesPerTimeValue)
+        tmp_sequence_pack = CommunicationManager.constructSequencePacket(operation)
+        [fields, timeout, error] = CommunicationManager.constructAcquisitionPacket(operation, tmp_sequence_pack, numAcqSamples, PROTOCOL_VERSION)
+        if error is not None:
+            names = list(self.sessions) if names is None else names
+            return FanOut({}, {name: "Sequence rejected: " + error for name in names}, self)
+        return self.submit(fields, names, timeout, CommunicationManager.expectedReplySize(numAcqSamples))
+
+# initialize an instance
+SessMngr = SessionManager()
@@ -0,0 +1,352 @@
+"""
+Signal Pipeline
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Processing of readouts as a pipeline of stages.
+            A stage reads buffers (sources) and writes one buffer (target), in place where
+            target and source are the same (e.g. DC removal on 'data'). Buffers are allocated
+            once per Frame, with the samples on the last axis, so a frame holds a single readout
+            or a stack of them (BatchDataManager).
+            Frame.get() only runs the stages the requested buffer depends on, e.g. the smoothed
+            magnitude of a relaxometry never needs the FFT.
+            Frame.feed() takes a readout in chunks as it arrives: stages that work sample by
+            sample (chunked) run on every chunk, the others once the readout is complete.
+            Operations can bring their own pipeline (operation.pipeline), default: defaultPipeline().
+"""
+
+# system includes
+import numpy as np
+from scipy.signal import lfilter
+
+# project includes
+from config import configvars
+from fftbackend import FFT
+
+class Stage:
+    sources: tuple = ('data',)
+    target: str = 'data'
+    chunked: bool = False  # can run on parts of a readout as they arrive
+
+    def configure(self, frame) -> None:
+        # allocate buffers, precompute windows (once per frame)
+        pass
+
+    def process(self, frame, start: int, stop: int) -> None:
+        # samples start:stop of the sources into the target (block stages get the whole readout)
+        raise NotImplementedError
+
+class DCRemoval(Stage):
+    # subtract the mean of the readout
+    def process(self, frame, start, stop):
+        data = frame.buffers['data']
+        data -= data.mean(axis=-1, keepdims=True)
+
+class Apodization(Stage):
+    chunked = True
+
+    def __init__(self, kind: str = 'exponential', width: float = 10.0):
+        """
+        Window on the time signal (line broadening)
+        @param kind:    'exponential' (Lorentzian broadening) or 'gaussian'
+        @param width:   line broadening in Hz
+        """
+        self.kind = kind
+        self.width = width
+
+    def configure(self, frame):
+        t = np.arange(frame.numSamples) * configvars.timePerSample * 1e-3  # s
+        if self.kind == 'gaussian':
+            window = np.exp(-(np.pi * self.width * t) ** 2 / (4 * np.log(2)))
+        else:
+            window = np.exp(-np.pi * self.width * t)
+        frame.buffers[self.windowName] = window.astype(np.float32)
+
+    @property
+    def windowName(self) -> str:
+        return '_apodization{}'.format(id(self))
+
+    def process(self, frame, start, stop):
+        frame.buffers['data'][..., start:stop] *= frame.buffers[self.windowName][start:stop]
+
+class Magnitude(Stage):
+    chunked = True
+
+    def __init__(self, source: str = 'data', target: str = 'magnitude'):
+        self.sources = (source,)
+        self.target = target
+
+    def configure(self, frame):
+        frame.allocate(self.target, np.float32)
+
+    def process(self, frame, start, stop):
+        np.abs(frame.buffers[self.sources[0]][..., start:stop], out=frame.buffers[self.target][..., start:stop])
+
+class RealPart(Stage):
+    chunked = True
+    target = 'real'
+
+    def configure(self, frame):
+        frame.allocate(self.target, np.float32)
+
+    def process(self, frame, start, stop):
+        np.copyto(frame.buffers[self.target][..., start:stop], frame.buffers['data'][..., start:stop].real)
+
+class RunningMean(Stage):
+    def __init__(self, source: str = 'magnitude', target: str = None, width: int = None):
+        """
+        Moving average, centered like np.convolve(x, np.ones(width) / width, mode='same'), O(n)
+        @param source:  buffer to smooth
+        @param target:  smoothed buffer (default: source + 'Smoothed')
+        @param width:   number of samples averaged (default: configvars.smoothingWidth)
+        """
+        self.sources = (source,)
+        self.target = target or source + 'Smoothed'
+        self.width = width or configvars.smoothingWidth
+
+    def configure(self, frame):
+        frame.allocate(self.target, np.float64)
+        frame.allocate('_sums' + self.target, np.float64, frame.numSamples + self.width)
+
+    def process(self, frame, start, stop):
+        n = frame.numSamples
+        sums = frame.buffers['_sums' + self.target]
+        offset = self.width // 2 + 1
+        sums[...] = 0
+        sums[..., offset:offset + n] = frame.buffers[self.sources[0]]
+        np.cumsum(sums, axis=-1, out=sums)
+        target = frame.buffers[self.target]
+        np.subtract(sums[..., self.width:self.width + n], sums[..., 0:n], out=target)
+        target /= self.width
+
+class IIRSmoothing(Stage):
+    chunked = True
+
+    def __init__(self, source: str = 'magnitude', target: str = None, timeConstant: float = None):
+        """
+        First order low pass (exponential smoothing), state carried over chunks
+        @param source:          buffer to smooth
+        @param target:          smoothed buffer (default: source + 'Smoothed')
+        @param timeConstant:    in samples (default: configvars.smoothingWidth / 2)
+        """
+        self.sources = (source,)
+        self.target = target or source + 'Smoothed'
+        self.timeConstant = timeConstant or configvars.smoothingWidth / 2
+
+    def configure(self, frame):
+        frame.allocate(self.target, np.float64)
+        frame.state[self.target] = np.zeros(frame.shape[:-1] + (1,))
+
+    def process(self, frame, start, stop):
+        a = 1 / self.timeConstant
+        if start == 0:
+            frame.state[self.target][...] = 0
+        [y, frame.state[self.target]] = lfilter([a], [1, a - 1], frame.buffers[self.sources[0]][..., start:stop],
+                                                axis=-1, zi=frame.state[self.target])
+        frame.buffers[self.target][..., start:stop] = y
+
+class ZeroFill(Stage):
+    sources = ()
+    target = None
+
+    def __init__(self, numBins: int = None):
+        # spectrum length (default: next FFT friendly length)
+        self.numBins = numBins
+
+    def configure(self, frame):
+        frame.numBins = self.numBins or FFT.fastLength(frame.numSamples)
+
+    def process(self, frame, start, stop):
+        pass
+
+class Spectrum(Stage):
+    target = 'spectrum'
+
+    def process(self, frame, start, stop):
+        # centered spectrum, the backend allocates its output
+        frame.buffers[self.target] = FFT.spectrum(frame.buffers['data'], frame.numSamples, frame.numBins, axis=-1)
+
+class PhaseCorrection(Stage):
+    sources = ('spectrum',)
+    target = 'spectrum'
+
+    def __init__(self, phase0: float = None, phase1: float = 0.0):
+        """
+        Phase correction of the spectrum
+        @param phase0:  zero order phase in rad (default: real peak)
+        @param phase1:  first order phase in rad over the whole spectrum
+        """
+        self.phase0 = phase0
+        self.phase1 = phase1
+
+    def process(self, frame, start, stop):
+        spectrum = frame.buffers['spectrum']
+        if self.phase0 is None:
+            peak = np.take_along_axis(spectrum, np.argmax(np.abs(spectrum), axis=-1)[..., np.newaxis], axis=-1)
+            phase0 = -np.angle(peak)
+        else:
+            phase0 = self.phase0
+        phase = phase0 + self.phase1 * (np.arange(frame.numBins) / frame.numBins - 0.5)
+        spectrum *= np.exp(1j * phase).astype(spectrum.dtype)
+
+class SpectrumMagnitude(Stage):
+    sources = ('spectrum',)
+    target = 'spectrumMagnitude'
+
+    def process(self, frame, start, stop):
+        frame.buffers[self.target] = np.abs(frame.buffers['spectrum'])
+
+class Frame:
+    def __init__(self, pipeline, shape: tuple):
+        """
+        Buffers of one readout (or a stack of readouts) going through a pipeline
+        @param pipeline:    Pipeline
+        @param shape:       shape of the readout(s), samples on the last axis
+        @return:            None
+        """
+        self.pipeline = pipeline
+        self.shape = tuple(shape)
+        self.numSamples = self.shape[-1]
+        self.numBins = self.numSamples  # spectrum length (ZeroFill)
+        self.buffers: dict = {}
+        self.state: dict = {}  # of chunked stages
+        self._ran: set = set()  # indices of stages done
+        self.filled = 0  # samples received
+        # data is only copied if a stage changes it in place
+        self._inplace = any(stage.target == 'data' for stage in pipeline.stages)
+        self._owned = True  # buffers['data'] belongs to the frame
+        if self._inplace:
+            self.allocate('data', np.complex64)
+        for stage in pipeline.stages:
+            stage.configure(self)
+
+    def allocate(self, name: str, dtype, length: int = None) -> np.ndarray:
+        if name not in self.buffers:
+            self.buffers[name] = np.zeros(self.shape[:-1] + (length or self.numSamples,), dtype)
+        return self.buffers[name]
+
+    @property
+    def complete(self) -> bool:
+        return self.filled >= self.numSamples
+
+    def load(self, data: np.ndarray) -> 'Frame':
+        """
+        Take a complete readout, results of earlier readouts are overwritten
+        @param data:    readout(s), cropped or zero-padded to the samples of the frame
+        @return:        self
+        """
+        self._ran.clear()
+        n = min(data.shape[-1], self.numSamples)
+        if not self._inplace and n == self.numSamples:
+            self.buffers['data'] = data[..., 0:n]  # no copy
+            self._owned = False
+        else:
+            buffer = self.allocate('data', np.complex64)
+            buffer[..., 0:n] = data[..., 0:n]
+            buffer[..., n:] = 0
+        self.filled = self.numSamples
+        return self
+
+    def feed(self, chunk: np.ndarray) -> bool:
+        """
+        Take the next samples of a readout, chunked stages run on them right away
+        @param chunk:   samples (last axis), following the ones fed before
+        @return:        readout complete
+        """
+        if self.filled == 0 or self.complete:
+            self._ran.clear()
+            self.filled = 0
+            if not self._owned:
+                del self.buffers['data']  # was the caller's readout
+                self._owned = True
+        start = self.filled
+        stop = min(start + chunk.shape[-1], self.numSamples)
+        self.allocate('data', np.complex64)[..., start:stop] = chunk[..., 0:stop - start]
+        self.filled = stop
+
+        streamable = {'data'}
+        streamed = []
+        for i, stage in enumerate(self.pipeline.stages):
+            if stage.chunked and all(source in streamable for source in stage.sources):
+                stage.process(self, start, stop)
+                streamed.append(i)
+            elif stage.target is not None:
+                streamable.discard(stage.target)
+        if self.complete:
+            self._ran.update(streamed)
+        return self.complete
+
+    def get(self, name: str) -> np.ndarray:
+        """
+        Buffer after the pipeline, runs the stages it depends on (once)
+        @param name:    name of the buffer (target of a stage or 'data')
+        @return:        buffer
+        """
+        stages = self.pipeline.stages
+        producers = [i for i, stage in enumerate(stages) if stage.target == name]
+        if not producers:
+            if name == 'data':
+                return self.buffers['data']
+            raise KeyError("No stage of the pipeline produces {}.".format(name))
+        run = set()
+        self._depend(producers[-1], run)
+        # stages reading a buffer that a later stage changes in place have to run before that
+        changed = True
+        while changed:
+            changed = False
+            for i in sorted(run):
+                if stages[i].target in stages[i].sources:
+                    for k in range(i):
+                        if k not in run and k not in self._ran and stages[i].target in stages[k].sources:
+                            self._depend(k, run)
+                            changed = True
+        for i in sorted(run):
+            stages[i].process(self, 0, self.numSamples)
+            self._ran.add(i)
+        return self.buffers[name]
+
+    def _depend(self, index: int, run: set) -> None:
+        # stage index and all earlier stages producing its sources (not run yet)
+        needed = set()
+        for i in range(index, -1, -1):
+            stage = self.pipeline.stages[i]
+            if i in self._ran:
+                continue
+            if i == index or stage.target in needed:
+                run.add(i)
+                needed.update(stage.sources)
+
+class Pipeline:
+    def __init__(self, stages: list):
+        """
+        Initialization of a pipeline
+        @param stages:  Stages in the order they are applied
+        @return:        None
+        """
+        self.stages = [stage for stage in stages if stage is not None]
+
+    def frame(self, data: np.ndarray = None, shape: tuple = None) -> Frame:
+        """
+        Buffers for a readout
+        @param data:    complete readout(s) (samples on the last axis)
+        @param shape:   shape of the readout(s), to feed() them in chunks
+        @return:        Frame
+        """
+        frame = Frame(self, shape if shape is not None else data.shape)
+        if data is not None:
+            frame.load(data)
+        return frame
+
+def defaultPipeline() -> Pipeline:
+    # traces and spectrum DataManager offers
+    return Pipeline([
+        Magnitude(),
+        RunningMean('magnitude'),
+        RealPart(),
+        RunningMean('real'),
+        ZeroFill() if configvars.fftZeroFill else None,
+        Spectrum(),
+        SpectrumMagnitude()
+    ])
@@ -0,0 +1,159 @@
+"""
+Spectral Peak
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Position, height and width of spectral peaks finer than one FFT bin.
+            interpolatePeak() fits a parabola through the maximum bin and its neighbours:
+                parabolic   on the magnitudes
+                gaussian    on the log of the magnitudes (exact for Gaussian lines)
+                lorentzian  on 1 / magnitude^2 (exact for the magnitude spectrum of an
+                            exponentially decaying signal, i.e. a Lorentzian line)
+            fitLorentzian() fits the power spectrum around the peak (least squares, few bins).
+            interpolatedFwhm() finds the half maximum crossings left and right of the peak,
+            linearly interpolated between bins.
+            peakPosition() applies what configvars.peakInterpolation and configvars.lorentzianFit ask for.
+            All work on the last axis, for one spectrum or a stack of them.
+"""
+
+# system includes
+import numpy as np
+from scipy.optimize import curve_fit
+
+# project includes
+from config import configvars
+
+METHODS = ('parabolic', 'gaussian', 'lorentzian')
+
+def _neighbours(magnitude: np.ndarray, peakIdx) -> list:
+    # magnitudes left of, at and right of the peak (edges: peak repeated, no offset)
+    n = magnitude.shape[-1]
+    peakIdx = np.asarray(peakIdx)[..., np.newaxis]
+    left = np.take_along_axis(magnitude, np.clip(peakIdx - 1, 0, n - 1), axis=-1)[..., 0]
+    center = np.take_along_axis(magnitude, peakIdx, axis=-1)[..., 0]
+    right = np.take_along_axis(magnitude, np.clip(peakIdx + 1, 0, n - 1), axis=-1)[..., 0]
+    return [left.astype(float), center.astype(float), right.astype(float)]
+
+def _vertex(a, b, c) -> list:
+    # offset (bins) and value of the vertex of the parabola through (-1, a), (0, b), (1, c)
+    denominator = a - 2 * b + c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denominator != 0, 0.5 * (a - c) / denominator, 0.0)
+    offset = np.clip(offset, -0.5, 0.5)
+    return [offset, b - 0.25 * (a - c) * offset]
+
+def interpolatePeak(magnitude: np.ndarray, peakIdx, method: str = 'lorentzian') -> list:
+    """
+    Sub-bin position and height of a peak
+    @param magnitude:   magnitude spectrum (last axis)
+    @param peakIdx:     index of the maximum (per spectrum)
+    @param method:      'parabolic', 'gaussian' or 'lorentzian'
+    @return:            [peak position in bins (float), peak height]
+    """
+    [a, b, c] = _neighbours(magnitude, peakIdx)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'gaussian':
+            tiny = np.finfo(float).tiny
+            [offset, value] = _vertex(np.log(np.maximum(a, tiny)), np.log(np.maximum(b, tiny)), np.log(np.maximum(c, tiny)))
+            value = np.exp(value)
+        elif method == 'lorentzian':
+            # 1 / |S|^2 is a parabola, its minimum is the peak
+            [offset, value] = _vertex(1 / a ** 2, 1 / b ** 2, 1 / c ** 2)
+            value = 1 / np.sqrt(value)
+        elif method == 'parabolic':
+            [offset, value] = _vertex(a, b, c)
+        else:
+            raise ValueError("Unknown peak interpolation {}, use one of {}.".format(method, METHODS))
+    # lines narrower than the model (e.g. a truncated readout) can put the vertex below zero
+    offset = np.where(np.isfinite(offset), offset, 0.0)
+    value = np.where(np.isfinite(value) & (value >= b), value, b)
+    return [np.asarray(peakIdx) + offset, value]
+
+def _lorentzian(x, amplitude, center, width, baseline):
+    # power spectrum of an exponentially decaying signal, width: FWHM
+    return amplitude / (1 + (2 * (x - center) / width) ** 2) + baseline
+
+def fitLorentzian(magnitude: np.ndarray, peakIdx: int, halfWindow: int = 8) -> list:
+    """
+    Least squares fit of a Lorentzian line to the power spectrum around the peak (one spectrum)
+    @param magnitude:   magnitude spectrum
+    @param peakIdx:     index of the maximum
+    @param halfWindow:  bins left and right of the peak used for the fit
+    @return:            [peak position in bins, peak height (magnitude), FWHM of the magnitude in bins]
+                        (interpolated values if the fit fails)
+    """
+    start = max(int(peakIdx) - halfWindow, 0)
+    stop = min(int(peakIdx) + halfWindow + 1, len(magnitude))
+    x = np.arange(start, stop, dtype=float)
+    power = magnitude[start:stop].astype(float) ** 2
+    [center, height] = interpolatePeak(magnitude, peakIdx, 'lorentzian')
+    width = interpolatedFwhm(magnitude, peakIdx, height)
+    interpolated = [float(center), float(height), float(width)]
+    # the magnitude is at half height where the power is at a quarter: power FWHM = width / sqrt(3)
+    guess = width / np.sqrt(3) if np.isfinite(width) and width > 0 else 1.0
+    try:
+        [[amplitude, center, width, baseline], _] = curve_fit(
+            _lorentzian, x, power, p0=[height ** 2, center, guess, 0.0], maxfev=2000)
+    except (RuntimeError, ValueError):
+        return interpolated
+    if not start <= center < stop or amplitude <= 0:
+        return interpolated
+    return [float(center), float(np.sqrt(amplitude + baseline)), float(abs(width) * np.sqrt(3))]
+
+def peakPosition(magnitude: np.ndarray, peakIdx, method: str = None, fit: bool = None) -> np.ndarray:
+    """
+    Position of the peak as configured
+    @param magnitude:   magnitude spectrum (last axis)
+    @param peakIdx:     index of the maximum (per spectrum)
+    @param method:      interpolation (default: configvars.peakInterpolation, 'none': the maximum bin)
+    @param fit:         refine by a Lorentzian fit (default: configvars.lorentzianFit)
+    @return:            peak position in bins (float)
+    """
+    method = configvars.peakInterpolation if method is None else method
+    fit = configvars.lorentzianFit if fit is None else fit
+    if fit:
+        rows = magnitude.reshape(-1, magnitude.shape[-1])
+        indices = np.broadcast_to(peakIdx, magnitude.shape[:-1]).reshape(-1)
+        positions = [fitLorentzian(row, idx)[0] for row, idx in zip(rows, indices)]
+        return np.reshape(positions, np.shape(peakIdx)) if np.ndim(peakIdx) else positions[0]
+    if method == 'none':
+        return np.asarray(peakIdx, dtype=float)
+    return interpolatePeak(magnitude, peakIdx, method)[0]
+
+def interpolatedFwhm(magnitude: np.ndarray, peakIdx, peakValue, window: int = None) -> np.ndarray:
+    """
+    Full width at half maximum, half maximum crossings interpolated between bins
+    @param magnitude:   magnitude spectrum (last axis)
+    @param peakIdx:     index of the maximum (per spectrum)
+    @param peakValue:   height of the peak (per spectrum)
+    @param window:      only search this many bins around the peak (default: whole spectrum)
+    @return:            FWHM in bins (float, nan where no crossing was found)
+    """
+    n = magnitude.shape[-1]
+    peakIdx = np.asarray(peakIdx)[..., np.newaxis]
+    half = np.asarray(peakValue, dtype=float)[..., np.newaxis] / 2
+    bins = np.arange(n)
+    below = magnitude < half
+    if window is not None:
+        below &= np.abs(bins - peakIdx) <= window // 2
+
+    # first bin below half maximum right of the peak, last one left of it
+    rightMask = below & (bins > peakIdx)
+    leftMask = below & (bins < peakIdx)
+    found = rightMask.any(axis=-1) & leftMask.any(axis=-1)
+    right = np.argmax(rightMask, axis=-1)
+    left = n - 1 - np.argmax(leftMask[..., ::-1], axis=-1)
+
+    def crossing(outside, inside):
+        # position between the bin below and its neighbour towards the peak
+        y0 = np.take_along_axis(magnitude, outside[..., np.newaxis], axis=-1)[..., 0].astype(float)
+        y1 = np.take_along_axis(magnitude, inside[..., np.newaxis], axis=-1)[..., 0].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(y1 != y0, (half[..., 0] - y0) / (y1 - y0), 0.0)
+        return outside + (inside - outside) * fraction
+
+    rightCrossing = crossing(right, np.maximum(right - 1, 0))
+    leftCrossing = crossing(left, np.minimum(left + 1, n - 1))
+    return np.where(found, rightCrossing - leftCrossing, np.nan)
@@ -2,10 +2,11 @@
 Time Value Manager
 
 @author:    Sula Mueller
-@version:   1.0.0
-@change:    06/11/2020
+@version:   1.1.0
+@change:    17/10/2026
 
 @summary:   Class to set time values in sequence files
+            (operations set time values in their own SequenceDocument, see operationmodes)
 """
 
 # system includes
@@ -14,12 +15,12 @@ from warnings import warn
 
 # project includes
 from globalvars import globals
-from assembler import Assembler
+from sequencedocument import loadDocument
 
 seq = globals.Sequences
 
 class TimeValueManager:
-    # is called from AcquisitionManger.runAcquisition or RelaxometerManager
+    # writes a time value into the sequence file on disk
     def __init__(self,
                  sequencefile: seq.SequenceFile,
                  T_val: int):  # time value in ms
@@ -29,26 +30,12 @@ class TimeValueManager:
 
         self.setTimeVal(T_val)
 
-    # Function to set time value of a sequence (TE/TI)
+    # Function to set time value of a sequence (TE/TI) in the sequence file
     def setTimeVal(self, T_val: int = 15) -> None:
-        f = open(self.sequencepath, 'r+')  # Open sequence and read lines
-        lines = f.readlines()
-        # Modify T_val time in correct line
-        if self.sequence is seq.SE:
-            lines[-10] = 'PR 3, ' + str(int(T_val / 2 * 1000 - 112)) + '\t// wait&r\n'
-            lines[-6] = 'PR 3, ' + str(int(T_val / 2 * 1000 - 975)) + '\t// wait&r\n'
-        elif self.sequence is seq.IR:
-            lines[-14] = 'PR 3, ' + str(int(T_val * 1000 - 198)) + '\t// wait&r\n'
-        elif self.sequence is seq.SIR:
-            lines[-9] = 'PR 3, ' + str(int(T_val * 1000 - 198)) + '\t// wait&r\n'
-            lines[-13] = 'PR 3, ' + str(int(T_val * 1000 - 198)) + '\t// wait&r\n'
-        else:
+        document = loadDocument(self.sequencepath)
+        if not document.has(self.sequence.T_name):
             warn("SetTimeValue is not implemented for this sequence type.")
-            f.close()  # Close and write/save modified sequence
             return
-        with open(self.sequencepath, "w") as out_file:
-            for line in lines:
-                out_file.write(line)
-        f.close()  # Close and write/save modified sequence
-                
-
+        document.set(self.sequence.T_name, T_val)
+        if document.dirty:
+            document.save()  # write/save modified sequence
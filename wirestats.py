@@ -0,0 +1,92 @@
+"""
+Wire Statistics
+
+@author:    Sula Mueller
+@version:   1.0.0
+@change:    17/10/2026
+
+@summary:   Timing of the requests sent to the console, to tell whether time is spent on the
+            client (encoding, decoding), on the network or on the console.
+            Every answered request leaves one record (see FIELDS), the last
+            configvars.wireStatsSize records are kept in a ring buffer. summary() gives
+            p50/p95/p99 of every field, dump() writes records and summary to JSON.
+"""
+
+# system includes
+import json
+import time
+import numpy as np
+from collections import deque
+
+# project includes
+from config import configvars
+
+# fields of a record: name -> unit
+FIELDS = {
+    'queued': 'ms',  # from sendRequest until written (request window full)
+    'encode': 'ms',  # sequence deduplication and msgpack encoding
+    'sent': 'bytes',  # bytes written
+    'firstByte': 'ms',  # from writing until the first byte of the reply (console and network latency)
+    'receive': 'ms',  # from first to last byte of the reply
+    'decode': 'ms',  # decoding the reply (all attempts on the incomplete buffer included)
+    'size': 'bytes',  # bytes of the reply
+    'roundTrip': 'ms'  # from writing until the reply was complete
+}
+PERCENTILES = (50, 95, 99)
+
+class WireStats:
+    def __init__(self, size: int = configvars.wireStatsSize):
+        """
+        Initialization of the ring buffer of request timings
+        @param size:    max. number of records kept (oldest are dropped)
+        @return:        None
+        """
+        self.records = deque(maxlen=size)
+
+    def record(self, packetIdx: int, command: int, **fields) -> dict:
+        """
+        Add the timing of an answered request
+        @param packetIdx:   index of the packet
+        @param command:     command of the packet
+        @param fields:      values of FIELDS (missing ones are None)
+        @return:            the record
+        """
+        entry = {'time': time.time(), 'packet': packetIdx, 'command': command}
+        entry.update({name: fields.get(name) for name in FIELDS})
+        self.records.append(entry)
+        return entry
+
+    def clear(self) -> None:
+        self.records.clear()
+
+    def values(self, field: str) -> np.ndarray:
+        # values of a field over all records that have it
+        return np.array([entry[field] for entry in self.records if entry.get(field) is not None], dtype=float)
+
+    def summary(self, field: str = None) -> dict:
+        """
+        Percentiles of the recorded fields
+        @param field:   field of FIELDS (default: all)
+        @return:        field -> {'count', 'mean', 'p50', 'p95', 'p99', 'unit'} (of one field if given)
+        """
+        result = {}
+        for name in ([field] if field is not None else FIELDS):
+            values = self.values(name)
+            stats = {'count': len(values), 'unit': FIELDS[name]}
+            if len(values):
+                stats['mean'] = float(np.mean(values))
+                stats.update({'p{}'.format(p): float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+            result[name] = stats
+        return result[field] if field is not None else result
+
+    def dump(self, path: str) -> None:
+        """
+        Write records and summary to a JSON file
+        @param path:    path of the file
+        @return:        None
+        """
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'records': list(self.records)}, f, indent=1)
+
+    def __len__(self) -> int:
+        return len(self.records)